@@ -30,6 +30,57 @@ https://awasu.com/api
 #               - This notice may not be removed or altered from any
 #                 source distribution.
 
+#pylint: disable=undefined-all-variable
+
+import importlib
+
 # NOTE: We bring these into the top-level namespace as a convenience (so that
 # callers can use "awasu_api.doodad" instead of "awasu_api.api.doodad").
-from awasu_api.api import AwasuApi , AwasuApiException
+# They are imported when they're first used, so that importing the package is fast
+# (since the modules that provide them can be slow to load, and may not be needed).
+_EXPORTS = {
+    "AwasuApi": "awasu_api.api",
+    "AwasuApiException": "awasu_api.api",
+    "AwasuApiResponse": "awasu_api.api",
+    "AsyncAwasuApi": "awasu_api.async_api",
+    "ResponseCache": "awasu_api.cache",
+    "CallMetrics": "awasu_api.metrics",
+    "MetricsAggregator": "awasu_api.metrics",
+    "AdaptiveLimiter": "awasu_api.limiter",
+    "StatsSampler": "awasu_api.sampler",
+    "Record": "awasu_api.records",
+    "ChannelDirectory": "awasu_api.directory",
+    "ChannelFolderTree": "awasu_api.folders",
+    "AwasuCluster": "awasu_api.cluster",
+    "ConfigSync": "awasu_api.sync",
+}
+
+__all__ = list( _EXPORTS.keys() )
+
+# NOTE: Static analysis tools (e.g. pylint, IDE's) can't see names that are provided by __getattr__(),
+# so we also import them here, in a block that never runs. We don't use typing.TYPE_CHECKING,
+# since importing the typing module would slow things down.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from awasu_api.api import AwasuApi, AwasuApiException, AwasuApiResponse
+    from awasu_api.async_api import AsyncAwasuApi
+    from awasu_api.cache import ResponseCache
+    from awasu_api.metrics import CallMetrics, MetricsAggregator
+    from awasu_api.limiter import AdaptiveLimiter
+    from awasu_api.sampler import StatsSampler
+    from awasu_api.records import Record
+    from awasu_api.directory import ChannelDirectory
+    from awasu_api.folders import ChannelFolderTree
+    from awasu_api.cluster import AwasuCluster
+    from awasu_api.sync import ConfigSync
+
+def __getattr__( name ):
+    module_name = _EXPORTS.get( name )
+    if not module_name:
+        raise AttributeError( "module '{}' has no attribute '{}'".format( __name__, name ) )
+    val = getattr( importlib.import_module( module_name ), name )
+    globals()[ name ] = val
+    return val
+
+def __dir__():
+    return sorted( set( globals().keys() ) | set( __all__ ) )
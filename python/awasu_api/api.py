@@ -30,21 +30,29 @@ https://awasu.com/api
 #               - This notice may not be removed or altered from any
 #                 source distribution.
 
-from xml.etree import ElementTree
+#pylint: disable=too-many-lines
+
+import os
 import json
 import zlib
 import re
+import time
+import collections
+import contextlib
+from io import BytesIO
 
+from awasu_api.connection import ConnectionPool
+from awasu_api.metrics import CallMetrics
+from awasu_api.records import make_records
+from awasu_api.utils import safe_xml_string, quote_xml_attr, bool_string, iter_concurrently, run_concurrently, \
+    lazy_import, futures
+
+# NOTE: These are slow to import, so we only load them when they're needed.
+ElementTree = lazy_import( "xml.etree.ElementTree" )
 try:
-    from urllib2 import Request, urlopen
-except ImportError:
-    from urllib.request import Request, urlopen
-try:
-    from StringIO import StringIO
+    import urllib2 as urllib_error
 except ImportError:
-    from io import StringIO
-
-from awasu_api.utils import safe_xml_string, bool_string
+    urllib_error = lazy_import( "urllib.error" )
 
 # ---------------------------------------------------------------------
 
@@ -60,19 +68,42 @@ class AwasuApiException( Exception ):
 
 # ---------------------------------------------------------------------
 
-class AwasuApi: #pylint: disable=too-many-public-methods
+class AwasuApi: #pylint: disable=too-many-public-methods,too-many-instance-attributes
     """Provides access to the Awasu API."""
 
     # NOTE: Since we're dealing with XML/JSON/HTML responses from Awasu,
     # strings are generally encoded bytes, not Unicode.
 
     DEFAULT_API_URL = "http://localhost:2604"
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_ID_BATCH_SIZE = 100
+    DEFAULT_LOG_LINES = 200
+    MIN_LOG_POLL_INTERVAL = 1
+    MAX_LOG_POLL_INTERVAL = 30
+    LOG_OVERLAP_LINES = 20
 
-    def __init__( self, url=None, token=None ):
+    def __init__( self, url=None, token=None, pool_size=None, idle_timeout=None, pool=None, max_response_size=None, cache=None, id_batch_size=None, limiter=None ): #pylint: disable=too-many-arguments,line-too-long
         self.api_url = url if url else AwasuApi.DEFAULT_API_URL
         self.api_token = token
+        # nb: API calls for more ID's than this will be split up, and sent to Awasu concurrently
+        self.id_batch_size = id_batch_size if id_batch_size is not None else AwasuApi.DEFAULT_ID_BATCH_SIZE
+        # nb: responses larger than this (after decompression) will be rejected
+        self.max_response_size = max_response_size
+        # NOTE: Connections to Awasu are kept open and re-used across calls (and threads),
+        # since setting up a new connection for every call is slow, and can cause socket exhaustion
+        # when stress-testing. A pool can be shared between multiple AwasuApi objects.
+        # nb: pool_size is the number of idle connections that will be kept open (it doesn't limit
+        # how many calls can be in progress at once - use an AdaptiveLimiter for that).
+        self.conn_pool = pool if pool else ConnectionPool( pool_size, idle_timeout )
+        # nb: a ResponseCache (optional)
+        self.response_cache = cache
+        # NOTE: If an AdaptiveLimiter is given, it will throttle the number of requests in flight to Awasu,
+        # to stop it from being overloaded when we have lots of threads making calls.
+        self.limiter = limiter
+        self._call_listeners = []
+        self._change_listeners = []
 
-    def call_api( self, api_name, api_args=None, post_data=None, raw=False, return_headers=False ): #pylint: disable=too-many-arguments,too-many-locals,too-many-branches
+    def call_api( self, api_name, api_args=None, post_data=None, raw=False, return_headers=False, sink=None ): #pylint: disable=too-many-arguments
         #pylint: disable=line-too-long
         """ This is the main entry point for calling the Awasu API.
         Most of the time, you won't need to call this method directly, since helper methods are provided for the most common operations.
@@ -88,58 +119,146 @@ class AwasuApi: #pylint: disable=too-many-public-methods
             resp = api.call_api( "workpads/get", { "id": "@", "format": "json" } )
             for item in resp["workpad"]["workpadItems"]:
                 print "%s => %s" % (item["title"], item["url"])
+
+        POST data can be passed in as an XML string, or an ElementTree element.
+
+        If a sink (a writable file-like object) is given, the response will be written to it as it is received,
+        instead of being returned.
         """
         #pylint: enable=line-too-long
+        with self._track_call( api_name ) as metrics:
+            return self._call_api( api_name, api_args, post_data, raw, return_headers, sink, metrics )
+
+    def _call_api( self, api_name, api_args, post_data, raw, return_headers, sink, metrics ): #pylint: disable=too-many-arguments
+        """Call the Awasu API."""
         # initialize the API arguments
         if not api_args:
             api_args = {}
-        if self.api_token:
-            api_args["token"] = self.api_token
-        # generate the request URL
-        url = "{}/{}".format( self.api_url, api_name )
-        if not url.startswith( "http://" ):
-            url = "http://" + url
-        # add the API arguments to the POST data
-        # NOTE: We do this to avoid exposing the token in GET request URL's.
-        if len(api_args) > 0:
-            if not post_data:
-                # no POST data was supplied - create a new data block
-                post_data = ElementTree.Element( "apiArgs" )
-                api_args_node = post_data
-            else:
-                # load the POST data
-                post_data = ElementTree.fromstring( post_data )
-                # NOTE: When parsing the POST data, Awasu stops after it has processed
-                # the <apiArgs> node, so it's advantageous to put it first (to avoid
-                # having to parse the entire XML tree).
-                api_args_node = ElementTree.Element( "apiArgs" )
-                post_data.insert( 0, api_args_node )
-            # add the API arguments to the POST data (as <apiArgs> attributes)
-            for key, val in api_args.items():
-                api_args_node.set( key, str(val) )
-            # convert the POST data back to a string
-            post_data = ElementTree.tostring( post_data )
+        # check if we have a cached response
+        cache = self.response_cache
+        cache_key = cache_generation = None
+        if cache is not None and post_data is None and sink is None:
+            cache_key = cache.make_key( self.api_url, self.api_token, api_name, api_args, raw )
+            cached_resp = cache.get( cache_key ) if cache_key else None
+            if cached_resp:
+                if metrics is not None:
+                    metrics.cached = True
+                hdrs_dict = dict( cached_resp[0] )
+                body = _parse_cached_response( cached_resp[1], api_args, raw, metrics )
+                return ( hdrs_dict, body ) if return_headers else body
+            cache_generation = cache.generation
         # send the request
-        req = Request( url, post_data, {"Accept-Encoding":"deflate"} )
-        resp = urlopen( req )
-        hdrs = str( resp.info() )
-        body = resp.read()
-        resp.close() # nb: try to stop socket exhaustion when stress-testing
+        conn, resp = self._send_api_request( api_name, api_args, post_data, True, metrics )
+        try:
+            hdrs_dict = parse_response_headers( resp.msg )
+            if cache_key:
+                # NOTE: We cache the raw response (and parse it each time it's used), so that
+                # callers can't corrupt the cache by modifying what we return to them.
+                body = read_response_body( resp, hdrs_dict, api_args, True, None, self.max_response_size, metrics )
+            else:
+                body = read_response_body( resp, hdrs_dict, api_args, raw, sink, self.max_response_size, metrics )
+        finally:
+            # nb: the connection will only be re-used if the response was read in full
+            self.conn_pool.release( conn, resp )
+        if cache_key:
+            cache.put( cache_key, ( hdrs_dict, body ), cache_generation )
+            body = _parse_cached_response( body, api_args, raw, metrics )
         # return the response
-        hdrs_dict = {} # FIXME! how to get the HTTP status code/message?
-        for line_buf in StringIO(hdrs):
-            mo = re.match( "^(\\s*[^()<>@,;:\\\"/\\[\\]?={} ]+)\\s*:\\s*(.*)$", line_buf )
-            if mo:
-                hdrs_dict[ mo.group(1) ] = mo.group(2).strip()
-        if hdrs_dict.get( "Content-Encoding" ) == "deflate":
-            body = zlib.decompressobj( -zlib.MAX_WBITS ).decompress( body )
-        if not raw:
-            if get_response_format( api_args ) == "xml":
-                body = ElementTree.fromstring( body ) if body.strip() else None
-            elif get_response_format( api_args ) == "json":
-                body = json.loads( body ) if body.strip() else None
         return ( hdrs_dict, body ) if return_headers else body
 
+    def iter_api_elements( self, api_name, tag, api_args=None, post_data=None ):
+        """Call the Awasu API, and yield XML elements with the specified tag as they are received.
+
+        The response is parsed incrementally as it arrives, and each element is discarded once
+        the caller has finished with it, so memory use stays flat no matter how large the response is e.g.
+            for node in api.iter_api_elements( "channels/list", "channel", {"verbose":1} ):
+                print( node.find( "name" ).text )
+        Elements are yielded as they are closed, so they are complete when the caller receives them,
+        but will be cleared when the next element is requested.
+        """
+        if api_args is None:
+            api_args = {}
+        api_args["format"] = "xml"
+        api_args["quiet"] = False
+        conn, resp = self._send_api_request( api_name, api_args, post_data )
+        try:
+            hdrs_dict = parse_response_headers( resp.msg )
+            parser = ElementTree.XMLPullParser( events=( "start", "end" ) )
+            node_stack = []
+            match_depth = 0 # nb: so that we don't yield matching elements nested inside each other
+            for chunk in iter_response_body( resp, hdrs_dict, max_size=self.max_response_size ):
+                parser.feed( chunk )
+                for event, node in parser.read_events():
+                    if event == "start":
+                        node_stack.append( node )
+                        if node.tag == tag:
+                            match_depth += 1
+                        continue
+                    node_stack.pop()
+                    if node.tag == "errorMsg" and len(node_stack) == 1:
+                        raise AwasuApiException( node.text )
+                    if node.tag != tag:
+                        continue
+                    match_depth -= 1
+                    if match_depth > 0:
+                        continue
+                    yield node
+                    # discard the element
+                    node.clear()
+                    if node_stack:
+                        node_stack[-1].remove( node )
+            parser.close()
+        finally:
+            # nb: if the caller stopped iterating early, the connection won't be re-used
+            self.conn_pool.release( conn, resp )
+
+    def get_api_response( self, api_name, api_args=None, post_data=None, raw=False ):
+        """Call the Awasu API, and return an AwasuApiResponse.
+
+        Unlike call_api(), HTTP errors are not raised as exceptions, and the response body is only read,
+        decompressed and parsed if it's needed, so this is useful for calls where the caller only wants
+        the status code or headers e.g.
+            with api.get_api_response( "reports/run", {"id":123} ) as resp:
+                print( resp.status )
+        """
+        if not api_args:
+            api_args = {}
+        conn, resp = self._send_api_request( api_name, api_args, post_data, False )
+        return AwasuApiResponse( self, conn, resp, api_name, api_args, raw )
+
+    def _send_api_request( self, api_name, api_args, post_data, check_status=True, metrics=None ): #pylint: disable=too-many-arguments
+        """Send a request to the Awasu API, and return the connection and response.
+
+        The caller is responsible for reading the response, then releasing the connection.
+        """
+        url, post_data, req_hdrs = make_api_request( self.api_url, self.api_token, api_name, api_args, post_data )
+        if metrics is not None and post_data:
+            metrics.bytes_sent = len( post_data )
+        limiter = self.limiter
+        start_time = limiter.acquire() if limiter else None
+        failed = True
+        try:
+            conn, resp = self.conn_pool.request(
+                "POST" if post_data else "GET", url, post_data, req_hdrs, metrics
+            )
+            # nb: a server error means that Awasu is struggling
+            failed = resp.status >= 500
+        finally:
+            # NOTE: The slot is held until the response starts arriving i.e. while Awasu is working
+            # on the request, but not while we're reading the response.
+            if limiter:
+                limiter.release( start_time, failed, api_name )
+            # NOTE: We do this even if the request failed, since Awasu may have still made changes.
+            if self.response_cache is not None:
+                self.response_cache.invalidate( api_name )
+        if check_status and resp.status >= 400:
+            try:
+                body = resp.read()
+            finally:
+                self.conn_pool.release( conn, resp )
+            raise urllib_error.HTTPError( url, resp.status, resp.reason, resp.msg, BytesIO(body) )
+        return conn, resp
+
     def get_awasu_build_info( self ):
         """Get the Awasu build info."""
         return self.call_api_and_check( "buildInfo", {"format":"json"} )[ "buildInfo" ]
@@ -160,6 +279,49 @@ class AwasuApi: #pylint: disable=too-many-public-methods
         """Get the Awasu Error log."""
         return self.call_api_and_check( "logs/error", {"lines":nLines}, None, True )
 
+    def follow_awasu_activity_log( self, nLines=None, min_interval=None, max_interval=None ):
+        """Follow the Awasu Activity log (generator).
+
+        This polls the log, and yields only new lines, starting with the last nLines.
+        """
+        return self._follow_log( "logs/activity", nLines, min_interval, max_interval )
+
+    def follow_awasu_error_log( self, nLines=None, min_interval=None, max_interval=None ):
+        """Follow the Awasu Error log (generator).
+
+        This polls the log, and yields only new lines, starting with the last nLines.
+        """
+        return self._follow_log( "logs/error", nLines, min_interval, max_interval )
+
+    def _follow_log( self, api_name, n_lines, min_interval, max_interval ):
+        """Poll an Awasu log, and yield new lines as they appear."""
+        n_lines = n_lines or AwasuApi.DEFAULT_LOG_LINES
+        min_interval = min_interval if min_interval is not None else AwasuApi.MIN_LOG_POLL_INTERVAL
+        max_interval = max_interval if max_interval is not None else AwasuApi.MAX_LOG_POLL_INTERVAL
+        seen = None
+        n_fetch = n_lines
+        interval = min_interval
+        while True:
+            lines = self.call_api_and_check( api_name, {"lines":n_fetch}, None, True ).splitlines()
+            if seen is None:
+                new_lines = lines
+            else:
+                overlap = find_log_overlap( seen, lines )
+                if overlap == 0 and len(lines) >= n_fetch and n_fetch < n_lines:
+                    # nb: everything we got was new, so we may have missed some lines - try again with more
+                    n_fetch = n_lines
+                    continue
+                new_lines = lines[ overlap: ]
+            yield from new_lines
+            seen = ( (seen or []) + new_lines )[ -n_lines: ]
+            # NOTE: Next time, we only fetch enough lines to find the overlap with what we've already seen,
+            # plus room for the new lines we expect (based on how many we just got), so that we're not
+            # downloading the same lines over and over again.
+            n_fetch = min( n_lines, 2*len(new_lines) + AwasuApi.LOG_OVERLAP_LINES )
+            # back off if the log is quiet
+            interval = min_interval if new_lines else min( 2*interval, max_interval )
+            time.sleep( interval )
+
     def get_channel_folders( self, tree=True ):
         """Get the channel folders."""
         if tree:
@@ -169,36 +331,41 @@ class AwasuApi: #pylint: disable=too-many-public-methods
 
     def create_channel_folder( self, folderName, parent_folder=None, insert_after=None ):
         """Create a new channel folder."""
-        api_args = { "name": folderName, "format": "json" }
-        if parent_folder:
-            api_args["parent"] = parent_folder
-        if insert_after:
-            api_args["after"] = insert_after
-        return self.call_api_and_check( "channels/folders/create", api_args )["status"]["id"]
+        api_args = make_channel_folder_args( folderName, parent_folder, insert_after )
+        folder_id = self.call_api_and_check( "channels/folders/create", api_args )["status"]["id"]
+        self._notify_change( "channels/folders/create", [ folder_id ], api_args )
+        return folder_id
 
     def delete_channel_folder( self, id ): #pylint: disable=redefined-builtin
         """Delete a channel folder."""
         self.call_api_and_check( "channels/folders/delete", {"id":id,"format":"json"} )
+        self._notify_change( "channels/folders/delete", [ id ] )
 
     def get_channel_filters( self ):
         """Get the channel filters."""
         return self.call_api_and_check( "channels/filters/list", {"format":"json"} )[ "channelFilters" ]
 
-    def get_channels( self, ids=None, verbose=False ):
-        """Get the configuration details for the specified channels."""
+    def get_channels( self, ids=None, verbose=False, records=False ):
+        """Get the configuration details for the specified channels.
+
+        If records is set, compact records are returned instead of dictionaries.
+        """
         api_args = { "format": "json", "verbose": verbose }
-        api_args = add_ids_to_api_args( api_args, ids )
-        return self.call_api_and_check( "channels/list", api_args )[ "channels" ]
+        channels = self._call_api_for_ids( "channels/list", api_args, ids, "channels" )
+        return make_records( channels, "Channel" ) if records else channels
+
+    def iter_channels( self, ids=None, verbose=False ):
+        """Get the configuration details for the specified channels, as a stream of XML elements."""
+        api_args = add_ids_to_api_args( { "verbose": verbose }, ids )
+        return self.iter_api_elements( "channels/list", "channel", api_args )
 
     def get_channel_stats( self, ids=None ):
         """Get the statistics for the specified channels."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        return self.call_api_and_check( "channels/stats", api_args )[ "channels" ]
+        return self._call_api_for_ids( "channels/stats", {"format":"json"}, ids, "channels" )
 
     def get_channel_errors( self, ids=None ):
         """Get the error log for the specified channels."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        return self.call_api_and_check( "channels/errors", api_args )[ "channels" ]
+        return self._call_api_for_ids( "channels/errors", {"format":"json"}, ids, "channels" )
 
     def get_channel_summary( self, id ): #pylint: disable=redefined-builtin
         """Get the summary for the specified channel."""
@@ -206,68 +373,87 @@ class AwasuApi: #pylint: disable=too-many-public-methods
             raise AwasuApiException( "Can't get multiple channels." )
         return self.call_api_and_check( "channels/get", {"id":id,"format":"html"} )
 
+    def save_channel_summary( self, id, dest ): #pylint: disable=redefined-builtin
+        """Save the summary for the specified channel to a file (or writable file object).
+
+        The response is streamed to the destination as it arrives. Returns the number of bytes written.
+        """
+        if isinstance( id, list ):
+            raise AwasuApiException( "Can't get multiple channels." )
+        return self._save_response( "channels/get", {"id":id,"format":"html"}, dest )
+
     def create_channel( self, post_data ):
         """Create a new channel."""
         resp = self.call_api_and_check( "channels/create", {"format":"json"}, post_data )
-        return int( resp["status"]["id"] )
+        channel_id = int( resp["status"]["id"] )
+        self._notify_change( "channels/create", [ channel_id ] )
+        return channel_id
     def create_channel_by_url( self, url ):
         """Create a new channel (downloaded from the specified URL)."""
-        return self.create_channel(
-            "<channel type='standard'>" \
-            "<feedUrl> {} </feedUrl>" \
-            "</channel>" \
-            .format( safe_xml_string( url ) )
-        )
+        return self.create_channel( make_channel_by_url_xml( url ) )
     def create_plugin_channel( self, plugin_path, plugin_params ):
         """Create a new plugin channel."""
-        params_xml = "".join( [
-            "<param name='{}'> {} </param>".format( safe_xml_string(key), safe_xml_string(val) ) \
-                for key,val in plugin_params.items()
-        ] )
-        return self.create_channel(
-            "<channel type='plugin'>" \
-              "<pluginChannel path='{}'> {} </pluginChannel>" \
-            "</channel>".format(
-                safe_xml_string(plugin_path), params_xml
-            )
-        )
+        return self.create_channel( make_plugin_channel_xml( plugin_path, plugin_params ) )
     def create_search_channel( self, query_string, search_locs=None, adv_syntax=False ):
         """Create a new search channel."""
-        attrs = { "advancedSyntax": bool_string(adv_syntax) }
-        if search_locs:
-            attrs["searchInTitles"] = bool_string( "titles" in search_locs )
-            attrs["searchInDescriptions"] = bool_string( "descriptions" in search_locs )
-        attrs = " ".join( [
-            "{}='{}'".format( key, val ) for key, val in attrs.items()
-        ] )
-        return self.create_channel(
-            "<channel type='search'>" \
-              "<searchQuery {}> {} </searchQuery>" \
-            "</channel>" \
-            .format( attrs, safe_xml_string(query_string) )
+        return self.create_channel( make_search_channel_xml( query_string, search_locs, adv_syntax ) )
+
+    def create_channels( self, post_datas, max_workers=None, progress=None ):
+        """Create multiple new channels.
+
+        The channels are created concurrently, and a list of the new channel ID's is returned
+        (in the same order as the channels were specified). If a channel can't be created,
+        its exception is returned in place of its ID, and the remaining channels are still created.
+        If a progress callback is given, it is called with the number of channels processed so far,
+        and the latest result.
+        """
+        return run_concurrently(
+            self.create_channel, post_datas, max_workers or AwasuApi.DEFAULT_MAX_WORKERS, progress
+        )
+    def create_channels_by_url( self, urls, max_workers=None, progress=None ):
+        """Create multiple new channels (downloaded from the specified URL's)."""
+        return self.create_channels(
+            ( make_channel_by_url_xml( url ) for url in urls ),
+            max_workers, progress
+        )
+    def create_plugin_channels( self, channel_specs, max_workers=None, progress=None ):
+        """Create multiple new plugin channels (each specified as a tuple of (plugin_path, plugin_params))."""
+        return self.create_channels(
+            ( make_plugin_channel_xml( *spec ) for spec in channel_specs ),
+            max_workers, progress
+        )
+    def create_search_channels( self, channel_specs, max_workers=None, progress=None ):
+        """Create multiple new search channels.
+
+        Each channel is specified as a query string, or a tuple of (query_string, search_locs, adv_syntax).
+        """
+        return self.create_channels(
+            ( make_search_channel_xml( *spec ) if isinstance( spec, tuple ) else make_search_channel_xml( spec ) \
+                for spec in channel_specs ),
+            max_workers, progress
         )
 
     def delete_channels( self, ids ):
         """Delete the specified channels."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        resp = self.call_api_and_check( "channels/delete", api_args )
-        for channel in resp["channels"]:
-            if channel["status"] != "OK":
-                raise AwasuApiException( "Can't delete channel \"{name}\" ({id}): {status}".format( **channel ) )
-
-    def get_reports( self, ids=None, verbose=False ):
-        """Get the configuration details for the specified reports."""
+        def check_results( channels ):
+            self._notify_change( "channels/delete", [ c["id"] for c in channels if c["status"] == "OK" ] )
+            check_item_statuses( channels, "Can't delete channel \"{name}\" ({id}): {status}" )
+        self._call_api_for_ids( "channels/delete", {"format":"json"}, ids, "channels", check_results )
+
+    def get_reports( self, ids=None, verbose=False, records=False ):
+        """Get the configuration details for the specified reports.
+
+        If records is set, compact records are returned instead of dictionaries.
+        """
         api_args = { "format": "json", "verbose": verbose }
-        api_args = add_ids_to_api_args( api_args, ids )
-        return self.call_api_and_check( "reports/list", api_args )[ "channelReports" ]
+        reports = self._call_api_for_ids( "reports/list", api_args, ids, "channelReports" )
+        return make_records( reports, "Report" ) if records else reports
 
     def run_reports( self, ids ):
         """Run the specified reports."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        resp = self.call_api_and_check( "reports/run", api_args )
-        for report in resp["channelReports"]:
-            if report["status"] != "OK":
-                raise AwasuApiException( "Can't run report \"{name}\" ({id}): {status}".format( **report ) )
+        self._call_api_for_ids( "reports/run", {"format":"json"}, ids, "channelReports",
+            lambda reports: check_item_statuses( reports, "Can't run report \"{name}\" ({id}): {status}" )
+        )
 
     def get_report( self, id ): #pylint: disable=redefined-builtin
         """Run the specified report and return the result."""
@@ -275,68 +461,42 @@ class AwasuApi: #pylint: disable=too-many-public-methods
             raise AwasuApiException( "Can't get multiple reports." )
         return self.call_api_and_check( "reports/get", {"id":id,"format":"html"} )
 
+    def save_report( self, id, dest ): #pylint: disable=redefined-builtin
+        """Run the specified report and save the result to a file (or writable file object).
+
+        The response is streamed to the destination as it arrives. Returns the number of bytes written.
+        """
+        if isinstance( id, list ):
+            raise AwasuApiException( "Can't get multiple reports." )
+        return self._save_response( "reports/get", {"id":id,"format":"html"}, dest )
+
     def create_report( self, post_data ):
         """Create a new report."""
         resp = self.call_api_and_check( "reports/create", {"format":"json"}, post_data )
         return resp["status"]["id"]
     def create_channel_filter_report( self, name, cf_name, descrip=None ):
         """Create a new report, based on the specified channel filter."""
-        return self.create_report(
-            "<channelReport>" \
-              "<name> {} </name>" \
-              "<description> {} </description>" \
-              "<dataSource type='channelFilter'>" \
-                "<channelFilterName> {} </channelFilterName>" \
-              "</dataSource>" \
-            "</channelReport>".format(
-                safe_xml_string(name), safe_xml_string(descrip), safe_xml_string(cf_name)
-            )
-        )
+        return self.create_report( make_channel_filter_report_xml( name, cf_name, descrip ) )
     def create_channel_folders_report( self, name, cf_ids, include_subfolders, descrip=None ):
         """Create a new report, based on the specified channel folders."""
-        if cf_ids:
-            channel_folders_xml = "".join( [ #pylint: disable=redefined-builtin
-                "<channelFolder id='{}'/>".format( safe_xml_string(id) ) \
-                    for id in cf_ids \
-            ] )
-        else:
-            channel_folders_xml = ""
-        return self.create_report(
-            "<channelReport>" \
-              "<name> {} </name>" \
-              "<description> {} </description>" \
-              "<dataSource type='channelFolders' includeSubFolders='{}'> {} </dataSource>" \
-            "</channelReport>".format(
-                safe_xml_string(name), safe_xml_string(descrip), "true" if include_subfolders \
-                    else "false", channel_folders_xml
-            )
-        )
+        return self.create_report( make_channel_folders_report_xml( name, cf_ids, include_subfolders, descrip ) )
     def create_workpad_report( self, name, workpad_id, descrip=None ):
         """Create a new report, based on the specified workpad."""
-        return self.create_report(
-            "<channelReport>" \
-              "<name> {} </name>" \
-              "<description> {} </description>" \
-              "<dataSource type='workpad'>" \
-                "<workpad id='{}'/>" \
-              "</dataSource>" \
-            "</channelReport>".format(
-                safe_xml_string(name), safe_xml_string(descrip), safe_xml_string(workpad_id)
-            )
-        )
+        return self.create_report( make_workpad_report_xml( name, workpad_id, descrip ) )
 
     def delete_reports( self, ids ):
         """Delete the specified reports."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        resp = self.call_api_and_check( "reports/delete", api_args )
-        for report in resp["channelReports"]:
-            if report["status"] != "OK":
-                raise AwasuApiException( "Can't delete report \"{name}\" ({id}): {status}".format( **report ) )
+        self._call_api_for_ids( "reports/delete", {"format":"json"}, ids, "channelReports",
+            lambda reports: check_item_statuses( reports, "Can't delete report \"{name}\" ({id}): {status}" )
+        )
+
+    def get_workpads( self, ids=None, records=False ):
+        """Get the configuration details for the specified workpads.
 
-    def get_workpads( self, ids=None ):
-        """Get the configuration details for the specified workpads."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        return self.call_api_and_check( "workpads/list", api_args )[ "workpads" ]
+        If records is set, compact records are returned instead of dictionaries.
+        """
+        workpads = self._call_api_for_ids( "workpads/list", {"format":"json"}, ids, "workpads" )
+        return make_records( workpads, "Workpad" ) if records else workpads
 
     def get_workpad( self, id ): #pylint: disable=redefined-builtin
         """Get the contents of the specified workpad."""
@@ -349,96 +509,789 @@ class AwasuApi: #pylint: disable=too-many-public-methods
         try:
             return self.get_workpad( "@" )
         except AwasuApiException as xcptn:
-            if str( xcptn ) == "No workpads were selected.":
+            if is_no_workpads_error( xcptn ):
                 return None
             raise
 
     def get_workpad_feed( self, id ): #pylint: disable=redefined-builtin
         """Get the feed XML for the specified workpad."""
         xml = self.call_api_and_check( "workpads/feed", {"id":id} )
-        nodes = xml.findall( "./errorMsg" )
-        if len(nodes) > 0:
-            raise AwasuApiException( nodes[0].text )
-        return ElementTree.tostring( xml )
+        return check_workpad_feed( xml )
+
+    def save_workpad_feed( self, id, dest ): #pylint: disable=redefined-builtin
+        """Save the feed XML for the specified workpad to a file (or writable file object).
+
+        The response is streamed to the destination as it arrives (it's not parsed and re-generated,
+        as get_workpad_feed() does). Returns the number of bytes written.
+        """
+        return self._save_response( "workpads/feed", {"id":id}, dest )
+
+    def iter_workpad_feed_items( self, id ): #pylint: disable=redefined-builtin
+        """Get the items in the feed for the specified workpad, as a stream of XML elements."""
+        return self.iter_api_elements( "workpads/feed", "item", {"id":id} )
 
     def add_workpad_item( self, workpad_ids, url, title=None, custom_fields=None ):
         """Add a new item to the specified workpads."""
-        api_args = { "url": url, "title": title, "format": "json" }
-        if custom_fields:
-            api_args.update( custom_fields )
-        api_args = add_ids_to_api_args( api_args, workpad_ids )
+        api_args = make_workpad_item_args( workpad_ids, url, title, custom_fields )
+        resp = self.call_api_and_check( "workpads/addItem", api_args )
+        check_item_statuses( resp["workpads"], "Can't add item to workpad \"{name}\" ({id}): {status}" )
+
+    def iter_add_workpad_items( self, workpad_ids, items, max_workers=None, progress=None ):
+        """Add multiple new items to the specified workpads.
+
+        Each item is specified as a URL, or a tuple of (url, title, custom_fields). Items are taken
+        from the iterable only as fast as they can be sent to Awasu, so it can be a generator
+        that produces any number of items, without them all being held in memory.
+
+        For each item, a tuple of (item, result) is yielded (in the same order as the items),
+        where the result is a dictionary that maps each workpad ID to the status returned by Awasu,
+        or an exception if the item couldn't be added.
+        """
+        def add_item( item ):
+            args = item if isinstance( item, tuple ) else ( item, )
+            try:
+                return item, self._add_workpad_item( workpad_ids, *args )
+            except Exception as xcptn: #pylint: disable=broad-exception-caught
+                return item, xcptn
+        max_workers = max_workers or AwasuApi.DEFAULT_MAX_WORKERS
+        yield from iter_concurrently( add_item, items, max_workers, progress )
+
+    def add_workpad_items( self, workpad_ids, items, max_workers=None, progress=None ):
+        """Add multiple new items to the specified workpads, and return how many times each status was returned.
+
+        Failed calls are counted under their error message.
+        """
+        counts = collections.Counter()
+        for _, result in self.iter_add_workpad_items( workpad_ids, items, max_workers, progress ):
+            if isinstance( result, Exception ):
+                counts[ str(result) ] += 1
+            else:
+                counts.update( result.values() )
+        return dict( counts )
+
+    def _add_workpad_item( self, workpad_ids, url, title=None, custom_fields=None ):
+        """Add a new item to the specified workpads, and return the status for each workpad."""
+        api_args = make_workpad_item_args( workpad_ids, url, title, custom_fields )
         resp = self.call_api_and_check( "workpads/addItem", api_args )
-        for workpad in resp["workpads"]:
-            if workpad["status"] != "OK":
-                raise AwasuApiException( "Can't add item to workpad \"{name}\" ({id}): {status}".format( **workpad ) )
+        return { workpad["id"]: workpad["status"] for workpad in resp["workpads"] }
 
     def create_workpad( self, name, descrip=None ):
         """Create a new workpad."""
-        post_data = \
-            "<workpad>" \
-              "<name> {} </name>" \
-              "<description> {} </description>" \
-            "</workpad>".format(
-                safe_xml_string(name), safe_xml_string(descrip)
-            )
+        post_data = make_workpad_xml( name, descrip )
         resp = self.call_api_and_check( "workpads/create", {"format":"json"}, post_data )
         return resp["status"]["id"]
 
     def delete_workpads( self, ids ):
         """Delete the specified workpads."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        resp = self.call_api_and_check( "workpads/delete", api_args )
-        for workpad in resp["workpads"]:
-            if workpad["status"] != "OK":
-                raise AwasuApiException( "Can't delete workpad \"{name}\" ({id}): {status}".format( **workpad ) )
+        self._call_api_for_ids( "workpads/delete", {"format":"json"}, ids, "workpads",
+            lambda workpads: check_item_statuses( workpads, "Can't delete workpad \"{name}\" ({id}): {status}" )
+        )
+
+    def get_feed_items( self, ids=None, records=False ):
+        """Get the specified feed items.
 
-    def get_feed_items( self, ids=None ):
-        """Get the specified feed items."""
-        api_args = add_ids_to_api_args( {"format":"json"}, ids )
-        return self.call_api_and_check( "feedItems/get", api_args )[ "feedItems" ]
+        If records is set, compact records are returned instead of dictionaries.
+        """
+        feed_items = self._call_api_for_ids( "feedItems/get", {"format":"json"}, ids, "feedItems" )
+        return make_records( feed_items, "FeedItem" ) if records else feed_items
 
     def run_search_query( self, query_string, search_locs=None, results_fmt="excerpt", adv_syntax=False, page_no=1, page_size=10 ): #pylint: disable=line-too-long,too-many-arguments
         """Run the specified search query."""
-        api_args = {
-            "query": query_string,
-            "fidf": results_fmt,
-            "advsyn": adv_syntax,
-            "page": page_no,
-            "pageSize": page_size,
-            "format": "json"
-        }
-        if search_locs:
-            api_args["locations"] = ",".join(search_locs) if isinstance(search_locs,list) else search_locs
+        api_args = make_search_query_args( query_string, search_locs, results_fmt, adv_syntax, page_no, page_size )
         return self.call_api_and_check( "search/query", api_args )[ "searchResults" ]
 
+    def iter_search_results( self, query_string, search_locs=None, results_fmt="excerpt", adv_syntax=False, page_size=100, prefetch=2 ): #pylint: disable=line-too-long,too-many-arguments
+        """Run the specified search query, and yield the results across all pages.
+
+        While the caller is processing one page of results, the next few pages are fetched in the background.
+        Only the current page and the pages being prefetched are held in memory.
+        """
+        def get_page( page_no ):
+            return self.run_search_query( query_string, search_locs, results_fmt, adv_syntax, page_no, page_size )
+        pending = collections.deque()
+        next_page_no = 1
+        with futures.ThreadPoolExecutor( max( prefetch, 1 ) ) as pool:
+            try:
+                while True:
+                    # start fetching the next few pages
+                    while len(pending) <= prefetch:
+                        pending.append( pool.submit( get_page, next_page_no ) )
+                        next_page_no += 1
+                    # return the results from the next page
+                    items = get_search_result_items( pending.popleft().result() )
+                    yield from items
+                    if len(items) < page_size:
+                        break
+            finally:
+                # nb: in case we ran out of results, or the caller stopped iterating early
+                for future in pending:
+                    future.cancel()
+
     def call_api_and_check( self, api_name, api_args=None, post_data=None, raw=False ):
         """Call the Awasu API and check for errors."""
         if api_args is None:
             api_args = {}
         api_args["quiet"] = False
-        response = self.call_api( api_name, api_args, post_data, raw, True )
-        # FIXME! Since we can't get the HTTP status code, we can't check it:-/
-        if not raw:
-            fmt = get_response_format( api_args )
-            if fmt == "json":
-                if response[1] and "status" in response[1] and "errorMsg" in response[1]["status"]:
-                    raise AwasuApiException( response[1]["status"]["errorMsg"] )
-            elif fmt == "xml":
-                if response[1] is not None:
-                    node = response[1].find( "./errorMsg" )
-                    if node is not None:
-                        raise AwasuApiException( node.text )
-            elif fmt == "html":
-                mo = re.search( b"<td class=\"error-msg value\">(.+?)</td>", response[1] )
-                if mo:
-                    raise AwasuApiException( mo.group(1).strip() )
-        return response[1]
+        with self._track_call( api_name ) as metrics:
+            # NOTE: call_api() raises an HTTPError if the HTTP status code indicates an error.
+            response = self._call_api( api_name, api_args, post_data, raw, True, None, metrics )
+            if not raw:
+                start_time = time.perf_counter()
+                check_response_body( response[1], api_args )
+                if metrics is not None:
+                    metrics.check_time = time.perf_counter() - start_time
+            return response[1]
+
+    def _save_response( self, api_name, api_args, dest ):
+        """Call the Awasu API, and stream the response to a file (or writable file object)."""
+        api_args["quiet"] = False
+        sink = _ResponseSink( dest, api_args )
+        try:
+            self.call_api( api_name, api_args, None, True, False, sink )
+            sink.close()
+        except:
+            sink.abort()
+            raise
+        return sink.nbytes
+
+    def add_call_listener( self, listener ):
+        """Add a listener that will be called with a CallMetrics object after every API call.
+
+        A MetricsAggregator can be used to collect these, and report them per endpoint.
+        """
+        self._call_listeners.append( listener )
+
+    def remove_call_listener( self, listener ):
+        """Remove a call listener."""
+        self._call_listeners.remove( listener )
+
+    @contextlib.contextmanager
+    def _track_call( self, api_name ):
+        """Collect metrics for an API call, and pass them on to the call listeners."""
+        if not self._call_listeners:
+            # nb: nobody's listening, so we don't bother collecting metrics
+            yield None
+            return
+        metrics = CallMetrics( api_name )
+        start_time = time.perf_counter()
+        try:
+            yield metrics
+        except Exception as xcptn:
+            metrics.error = xcptn
+            raise
+        finally:
+            metrics.total_time = time.perf_counter() - start_time
+            for listener in list( self._call_listeners ):
+                listener( metrics )
+
+    def add_change_listener( self, listener ):
+        """Add a listener that will be called when we make a change to Awasu's configuration.
+
+        The listener is called with the name of the API that made the change (e.g. "channels/create"),
+        a list of the affected ID's, and the API arguments used to make the change (or None).
+        """
+        self._change_listeners.append( listener )
+
+    def remove_change_listener( self, listener ):
+        """Remove a change listener."""
+        self._change_listeners.remove( listener )
+
+    def _notify_change( self, api_name, ids, api_args=None ):
+        """Notify the change listeners that we've changed Awasu's configuration."""
+        for listener in list( self._change_listeners ):
+            listener( api_name, ids, api_args )
+
+    def call_many( self, call_specs, max_workers=None, check=True ):
+        """Make multiple API calls concurrently.
+
+        Each call is specified as a tuple of (api_name, api_args, post_data), where the last two are optional e.g.
+            results = api.call_many( [
+                ( "channels/stats", {"id":123,"format":"json"} ),
+                ( "channels/errors", {"id":123,"format":"json"} ),
+            ] )
+        The results are returned in the same order as the calls. If a call fails, its exception
+        is returned in place of its result (the remaining calls are not affected).
+        """
+        def call_api( call_spec ):
+            api_name = call_spec[0]
+            api_args = dict( call_spec[1] ) if len(call_spec) > 1 and call_spec[1] else {}
+            post_data = call_spec[2] if len(call_spec) > 2 else None
+            if check:
+                return self.call_api_and_check( api_name, api_args, post_data )
+            else:
+                return self.call_api( api_name, api_args, post_data )
+        return run_concurrently( call_api, call_specs, max_workers or AwasuApi.DEFAULT_MAX_WORKERS )
+
+    def _call_api_for_ids( self, api_name, api_args, ids, result_key, check_results=None ): #pylint: disable=too-many-arguments
+        """Call the Awasu API for the specified ID's, and return the array of results.
+
+        Long lists of ID's are split into batches (of id_batch_size), which are sent to Awasu concurrently,
+        and the results are merged back together in the original order. If a check function is given,
+        it is called with the results; if any batches failed, it is called with the results of the ones
+        that succeeded, before the first failure is raised.
+        """
+        batch_size = self.id_batch_size
+        if not isinstance( ids, list ) or not batch_size or len(ids) <= batch_size:
+            api_args = add_ids_to_api_args( api_args, ids )
+            results = self.call_api_and_check( api_name, api_args )[ result_key ]
+            if check_results:
+                check_results( results )
+            return results
+        def call_api( batch ):
+            batch_api_args = add_ids_to_api_args( dict(api_args), batch )
+            return self.call_api_and_check( api_name, batch_api_args )[ result_key ]
+        batches = [ ids[i:i+batch_size] for i in range( 0, len(ids), batch_size ) ]
+        results, errors = [], []
+        for result in run_concurrently( call_api, batches, AwasuApi.DEFAULT_MAX_WORKERS ):
+            if isinstance( result, Exception ):
+                errors.append( result )
+            else:
+                results.extend( result )
+        # NOTE: If a batch failed, the other batches may still have made changes (e.g. deleted channels),
+        # so we always let the caller process the results we did get.
+        if check_results:
+            try:
+                check_results( results )
+            except Exception as xcptn: #pylint: disable=broad-except
+                if not errors:
+                    raise
+                raise errors[0] from xcptn
+        if errors:
+            raise errors[0]
+        return results
+
+    def close( self ):
+        """Close any open connections to Awasu."""
+        self.conn_pool.close()
 
     def __str__( self ):
         return "AwasuApi @ {}".format( self.api_url )
 
 # ---------------------------------------------------------------------
 
+class AwasuApiResponse: #pylint: disable=too-many-instance-attributes
+    """Holds a response from the Awasu API.
+
+    The HTTP status code and headers are available immediately. The response body is only read,
+    decompressed and parsed when it's first accessed, and if it's never needed, close() discards it
+    without processing it. The headers are a case-insensitive mapping.
+    """
+
+    def __init__( self, api, conn, resp, api_name, api_args, raw ): #pylint: disable=too-many-arguments
+        self.api_name = api_name
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.msg
+        self._api = api
+        self._conn = conn
+        self._resp = resp
+        self._api_args = api_args
+        self._raw = raw
+        self._raw_body = None
+        self._body = None
+        self._body_parsed = False
+
+    @property
+    def raw_body( self ):
+        """The response body (decompressed, but not parsed)."""
+        if self._raw_body is None:
+            if self._body_parsed:
+                raise AwasuApiException( "The response body has already been consumed." )
+            self._raw_body = self._read_body( True )
+        return self._raw_body
+
+    @property
+    def body( self ):
+        """The response body (parsed, unless the response was requested in raw mode)."""
+        if not self._body_parsed:
+            if self._raw_body is not None:
+                self._body = read_response_body( BytesIO( self._raw_body ), {}, self._api_args, self._raw )
+            else:
+                # nb: parse the response directly as it's read
+                self._body = self._read_body( self._raw )
+            self._body_parsed = True
+        return self._body
+
+    def check( self ):
+        """Check the response for errors."""
+        if self.status >= 400:
+            raise urllib_error.HTTPError(
+                self.api_name, self.status, self.reason, self.headers, BytesIO(self.raw_body)
+            )
+        if not self._raw:
+            check_response_body( self.body, self._api_args )
+
+    def close( self ):
+        """Discard any unread response body, and release the connection."""
+        if self._conn is None:
+            return
+        try:
+            # NOTE: We read (but don't decompress or parse) what's left of the response,
+            # so that the connection can be re-used.
+            while self._resp.read( 64*1024 ):
+                pass
+        finally:
+            self._release()
+
+    def _read_body( self, raw ):
+        """Read the response body."""
+        if self._conn is None:
+            raise AwasuApiException( "The response has been closed." )
+        try:
+            hdrs_dict = parse_response_headers( self.headers )
+            return read_response_body( self._resp, hdrs_dict, self._api_args, raw, None, self._api.max_response_size )
+        finally:
+            self._release()
+
+    def _release( self ):
+        """Release the connection."""
+        self._api.conn_pool.release( self._conn, self._resp )
+        self._conn = self._resp = None
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        self.close()
+
+    def __str__( self ):
+        return "AwasuApiResponse: {} {}".format( self.status, self.reason )
+
+# ---------------------------------------------------------------------
+
+class _ResponseSink:
+    """Writes a streamed API response to a file (or writable file object).
+
+    Awasu reports errors in the body of the response, so we hold back the first part of the response,
+    and check it for an error message before writing anything. If there was an error, the destination
+    file doesn't get created.
+    """
+
+    # NOTE: Error responses are small, so this is enough to be sure we've seen the error message (if any).
+    CHECK_SIZE = 64 * 1024
+
+    def __init__( self, dest, api_args ):
+        self.dest = dest
+        self.api_args = api_args
+        self.nbytes = 0
+        self._leading_data = bytearray()
+        self._fp = None
+
+    def write( self, data ):
+        """Write part of the response."""
+        if self._leading_data is not None:
+            self._leading_data += data
+            if len(self._leading_data) >= _ResponseSink.CHECK_SIZE:
+                self._write_leading_data( False )
+            return
+        self._fp.write( data )
+        self.nbytes += len(data)
+
+    def close( self ):
+        """Finish writing the response."""
+        if self._leading_data is not None:
+            self._write_leading_data( True )
+        if self._fp is not self.dest:
+            self._fp.close()
+
+    def abort( self ):
+        """Clean up after a failed response."""
+        if self._fp is not None and self._fp is not self.dest:
+            # nb: don't leave a partial file lying around
+            self._fp.close()
+            os.remove( self.dest )
+
+    def _write_leading_data( self, complete ):
+        """Check the start of the response for an error, then write it out."""
+        check_response_prefix( bytes( self._leading_data ), self.api_args, complete )
+        # NOTE: We only open the file once we know there was no error.
+        if isinstance( self.dest, ( str, os.PathLike ) ):
+            self._fp = open( self.dest, "wb" ) #pylint: disable=consider-using-with
+        else:
+            self._fp = self.dest
+        self._fp.write( self._leading_data )
+        self.nbytes += len(self._leading_data)
+        self._leading_data = None
+
+# ---------------------------------------------------------------------
+
+# NOTE: The functions below build the requests sent to Awasu, and process the responses that come back.
+# They are shared by AwasuApi and AsyncAwasuApi, so that the two stay in sync.
+
+def make_api_request( api_url, api_token, api_name, api_args, post_data ):
+    """Generate the URL, POST data and headers for an API request."""
+    # initialize the API arguments
+    if api_token:
+        api_args["token"] = api_token
+    # generate the request URL
+    url = "{}/{}".format( api_url, api_name )
+    if not url.startswith( ( "http://", "https://" ) ):
+        url = "http://" + url
+    # add the API arguments to the POST data
+    # NOTE: We do this to avoid exposing the token in GET request URL's.
+    if len(api_args) > 0:
+        post_data = add_api_args_to_post_data( post_data, api_args )
+    elif post_data is not None and not isinstance( post_data, ( str, bytes ) ):
+        post_data = ElementTree.tostring( post_data )
+    # generate the request headers
+    req_hdrs = { "Accept-Encoding": "deflate" }
+    if post_data:
+        req_hdrs["Content-Type"] = "application/x-www-form-urlencoded"
+        if not isinstance( post_data, bytes ):
+            post_data = post_data.encode( "utf-8" )
+    return url, post_data, req_hdrs
+
+def add_api_args_to_post_data( post_data, api_args ):
+    """Add the API arguments to the POST data (as <apiArgs> attributes).
+
+    The POST data can be an XML string, or an ElementTree element. Since it can be large, we splice
+    the <apiArgs> node into the XML text, rather than parsing it and converting it back to a string.
+    """
+    # generate the <apiArgs> node
+    api_args_xml = "<apiArgs {}/>".format(
+        " ".join( "{}={}".format( key, quote_xml_attr( val ) ) for key, val in api_args.items() )
+    ).encode( "utf-8" )
+    if post_data is None or len(post_data) == 0:
+        # no POST data was supplied - just send the <apiArgs> node
+        return api_args_xml
+    # NOTE: When parsing the POST data, Awasu stops after it has processed
+    # the <apiArgs> node, so it's advantageous to put it first (to avoid
+    # having to parse the entire XML tree).
+    if isinstance( post_data, str ):
+        # NOTE: We send the POST data as UTF-8, so any XML declaration (which might specify
+        # a different encoding) has to be removed.
+        post_data = re.sub( "^\ufeff?\\s*<\\?xml\\b.*?\\?>", "", post_data, count=1, flags=re.DOTALL )
+        post_data = post_data.encode( "utf-8" )
+    elif isinstance( post_data, bytes ) and not _is_utf8_xml( post_data ):
+        # NOTE: The <apiArgs> node we splice in is UTF-8, so if the POST data uses a different encoding,
+        # we fall back to parsing it (which is slower, but ElementTree will convert it for us).
+        post_data = ElementTree.fromstring( post_data )
+    # nb: we check for bytes first, so that we don't load ElementTree unless we need to
+    if not isinstance( post_data, bytes ) and isinstance( post_data, ElementTree.Element ):
+        api_args_node = ElementTree.fromstring( api_args_xml )
+        post_data.insert( 0, api_args_node )
+        try:
+            return ElementTree.tostring( post_data )
+        finally:
+            # nb: leave the caller's element the way we found it
+            post_data.remove( api_args_node )
+    if post_data.startswith( b"\xef\xbb\xbf" ):
+        # nb: remove the UTF-8 BOM (e.g. if the POST data was read from a file saved by a Windows editor)
+        post_data = post_data[ 3: ]
+    # locate the start tag for the root element (skipping over any XML declaration, comments, DOCTYPE, etc.)
+    mo = re.match(
+        b"(?:\\s+|<\\?.*?\\?>|<!--.*?-->|<!DOCTYPE[^[>]*(?:\\[.*?\\])?\\s*>)*" \
+        b"<([^\\s/>!?]+)(?:\\s+[^\\s=/>]+\\s*=\\s*(?:\"[^\"]*\"|'[^']*'))*\\s*(/?)>",
+        post_data, re.DOTALL
+    )
+    if not mo:
+        raise AwasuApiException( "Can't find the root element in the POST data." )
+    if mo.group(2):
+        # the root element is empty (e.g. "<channel/>") - give it a closing tag
+        return post_data[ : mo.start(2) ] + b">" + api_args_xml + b"</" + mo.group(1) + b">" + post_data[ mo.end() : ]
+    return post_data[ : mo.end() ] + api_args_xml + post_data[ mo.end() : ]
+
+def _is_utf8_xml( xml ):
+    """Check if an XML document (as bytes) is encoded as UTF-8."""
+    if xml.startswith( ( b"\xff\xfe", b"\xfe\xff" ) ):
+        return False # nb: UTF-16 BOM
+    # NOTE: If an XML document doesn't declare its encoding, it's UTF-8 (or UTF-16, if it has a BOM).
+    mo = re.match( b"(?:\xef\xbb\xbf)?\\s*<\\?xml\\b[^>]*?\\bencoding\\s*=\\s*[\"']([^\"']*)[\"']", xml )
+    return not mo or mo.group(1).lower() in ( b"utf-8", b"utf8" )
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def parse_response_headers( msg ):
+    """Convert the HTTP response headers to a dictionary."""
+    return dict( msg.items() )
+
+def read_response_body( fp, hdrs_dict, api_args, raw, sink=None, max_size=None, metrics=None ): #pylint: disable=too-many-arguments
+    """Read, decompress and parse an API response.
+
+    The response is processed in chunks as it arrives: it is decompressed chunk-by-chunk,
+    and XML is fed into the parser as it is decompressed, so the full compressed response
+    is never held in memory. If a sink is given, the response is written to it, and nothing is returned.
+    """
+    chunks = iter_response_body( fp, hdrs_dict, max_size=max_size, metrics=metrics )
+    if sink is not None:
+        for chunk in chunks:
+            sink.write( chunk )
+        return None
+    fmt = None if raw else get_response_format( api_args )
+    if fmt == "xml":
+        parser = None
+        for chunk in chunks:
+            if not parser:
+                # NOTE: An empty response (or one that contains only whitespace) is returned as None.
+                if not chunk.strip():
+                    continue
+                parser = ElementTree.XMLParser()
+            start_time = time.perf_counter()
+            parser.feed( chunk )
+            if metrics is not None:
+                metrics.parse_time += time.perf_counter() - start_time
+        return parser.close() if parser else None
+    # NOTE: The json module can't parse incrementally, so we have to assemble the full response first.
+    body = b"".join( chunks )
+    if fmt == "json":
+        start_time = time.perf_counter()
+        body = json.loads( body ) if body.strip() else None
+        if metrics is not None:
+            metrics.parse_time += time.perf_counter() - start_time
+    return body
+
+def _parse_cached_response( body, api_args, raw, metrics ):
+    """Parse a cached response."""
+    start_time = time.perf_counter()
+    body = read_response_body( BytesIO( body ), {}, api_args, raw )
+    if metrics is not None:
+        metrics.parse_time += time.perf_counter() - start_time
+    return body
+
+def iter_response_body( fp, hdrs_dict, chunk_size=64*1024, max_size=None, metrics=None ): #pylint: disable=too-many-branches
+    """Read an HTTP response body in chunks, decompressing it as it arrives."""
+    decompressor = zlib.decompressobj( -zlib.MAX_WBITS ) \
+        if hdrs_dict.get( "Content-Encoding" ) == "deflate" else None
+    nbytes = 0
+    def check_size( chunk ):
+        nonlocal nbytes
+        nbytes += len(chunk)
+        if metrics is not None:
+            metrics.bytes_decompressed = nbytes
+        if max_size is not None and nbytes > max_size:
+            raise AwasuApiException( "The response is too large (max={}).".format( max_size ) )
+    while True:
+        start_time = time.perf_counter()
+        chunk = fp.read( chunk_size )
+        if metrics is not None:
+            metrics.read_time += time.perf_counter() - start_time
+            metrics.bytes_received += len( chunk )
+        if not chunk:
+            break
+        if not decompressor:
+            check_size( chunk )
+            yield chunk
+            continue
+        # NOTE: We limit how much data gets decompressed at a time, so that
+        # a highly-compressed response can't blow out memory usage.
+        while chunk:
+            start_time = time.perf_counter()
+            data = decompressor.decompress( chunk, chunk_size )
+            if metrics is not None:
+                metrics.inflate_time += time.perf_counter() - start_time
+            if data:
+                check_size( data )
+                yield data
+            chunk = decompressor.unconsumed_tail
+    if decompressor:
+        data = decompressor.flush()
+        if data:
+            check_size( data )
+            yield data
+
+def check_response_body( body, api_args ):
+    """Check a parsed API response for errors."""
+    fmt = get_response_format( api_args )
+    if fmt == "json":
+        if body and "status" in body and "errorMsg" in body["status"]:
+            raise AwasuApiException( body["status"]["errorMsg"] )
+    elif fmt == "xml":
+        if body is not None:
+            node = body.find( "./errorMsg" )
+            if node is not None:
+                raise AwasuApiException( node.text )
+    elif fmt == "html":
+        mo = re.search( b"<td class=\"error-msg value\">(.+?)</td>", body )
+        if mo:
+            raise AwasuApiException( mo.group(1).strip() )
+
+def check_response_prefix( data, api_args, complete ):
+    """Check the start of an (unparsed) API response for errors.
+
+    This lets us check a response that is being streamed somewhere, without having to parse all of it.
+    """
+    fmt = get_response_format( api_args )
+    if fmt == "html":
+        check_response_body( data, api_args )
+    elif fmt == "xml":
+        # NOTE: Errors are returned as an <errorMsg> node directly under the root, so we parse just enough
+        # to find it. The data may be incomplete, but the parser doesn't care until it's closed.
+        parser = ElementTree.XMLPullParser( events=( "start", "end" ) )
+        depth = 0
+        try:
+            parser.feed( data )
+            for event, elem in parser.read_events():
+                if event == "start":
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 1 and elem.tag == "errorMsg":
+                    raise AwasuApiException( elem.text or "" )
+        except ElementTree.ParseError:
+            pass # nb: we're just looking for an error message, the caller gets the data regardless
+    elif fmt == "json" and complete and data.strip():
+        # nb: errors are small, so we only check JSON responses that we have in full
+        check_response_body( json.loads( data ), api_args )
+
+def check_item_statuses( items, errmsg_fmt ):
+    """Check the per-item statuses returned by a multi-item API call."""
+    for item in items:
+        if item["status"] != "OK":
+            raise AwasuApiException( errmsg_fmt.format( **item ) )
+
+def check_workpad_feed( xml ):
+    """Check a workpad feed for errors, and return it as XML."""
+    nodes = xml.findall( "./errorMsg" )
+    if len(nodes) > 0:
+        raise AwasuApiException( nodes[0].text )
+    return ElementTree.tostring( xml )
+
+def find_log_overlap( seen, lines ):
+    """Find how many lines at the start of a freshly-fetched log have already been seen.
+
+    This is the largest k where the last k lines seen match the first k lines fetched.
+    """
+    # NOTE: We only need to check the positions where the first fetched line appears.
+    first_line = lines[0] if lines else None
+    start = max( len(seen) - len(lines), 0 )
+    for pos in range( start, len(seen) ):
+        if seen[pos] == first_line and seen[pos:] == lines[ :len(seen)-pos ]:
+            return len(seen) - pos
+    return 0
+
+def is_no_workpads_error( xcptn ):
+    """Check if an exception was raised because there were no workpads."""
+    return str( xcptn ) == "No workpads were selected."
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def make_channel_folder_args( folder_name, parent_folder, insert_after ):
+    """Generate the API arguments to create a new channel folder."""
+    api_args = { "name": folder_name, "format": "json" }
+    if parent_folder:
+        api_args["parent"] = parent_folder
+    if insert_after:
+        api_args["after"] = insert_after
+    return api_args
+
+def make_channel_by_url_xml( url ):
+    """Generate the XML to create a new channel (downloaded from the specified URL)."""
+    return "<channel type='standard'>" \
+             "<feedUrl> {} </feedUrl>" \
+           "</channel>" \
+           .format( safe_xml_string( url ) )
+
+def make_plugin_channel_xml( plugin_path, plugin_params ):
+    """Generate the XML to create a new plugin channel."""
+    params_xml = "".join( [
+        "<param name='{}'> {} </param>".format( safe_xml_string(key), safe_xml_string(val) ) \
+            for key,val in plugin_params.items()
+    ] )
+    return "<channel type='plugin'>" \
+             "<pluginChannel path='{}'> {} </pluginChannel>" \
+           "</channel>".format(
+               safe_xml_string(plugin_path), params_xml
+           )
+
+def make_search_channel_xml( query_string, search_locs=None, adv_syntax=False ):
+    """Generate the XML to create a new search channel."""
+    attrs = { "advancedSyntax": bool_string(adv_syntax) }
+    if search_locs:
+        attrs["searchInTitles"] = bool_string( "titles" in search_locs )
+        attrs["searchInDescriptions"] = bool_string( "descriptions" in search_locs )
+    attrs = " ".join( [
+        "{}='{}'".format( key, val ) for key, val in attrs.items()
+    ] )
+    return "<channel type='search'>" \
+             "<searchQuery {}> {} </searchQuery>" \
+           "</channel>" \
+           .format( attrs, safe_xml_string(query_string) )
+
+def make_channel_filter_report_xml( name, cf_name, descrip=None ):
+    """Generate the XML to create a new report, based on the specified channel filter."""
+    return "<channelReport>" \
+             "<name> {} </name>" \
+             "<description> {} </description>" \
+             "<dataSource type='channelFilter'>" \
+               "<channelFilterName> {} </channelFilterName>" \
+             "</dataSource>" \
+           "</channelReport>".format(
+               safe_xml_string(name), safe_xml_string(descrip), safe_xml_string(cf_name)
+           )
+
+def make_channel_folders_report_xml( name, cf_ids, include_subfolders, descrip=None ):
+    """Generate the XML to create a new report, based on the specified channel folders."""
+    if cf_ids:
+        channel_folders_xml = "".join( [ #pylint: disable=redefined-builtin
+            "<channelFolder id='{}'/>".format( safe_xml_string(id) ) \
+                for id in cf_ids \
+        ] )
+    else:
+        channel_folders_xml = ""
+    return "<channelReport>" \
+             "<name> {} </name>" \
+             "<description> {} </description>" \
+             "<dataSource type='channelFolders' includeSubFolders='{}'> {} </dataSource>" \
+           "</channelReport>".format(
+               safe_xml_string(name), safe_xml_string(descrip), "true" if include_subfolders \
+                   else "false", channel_folders_xml
+           )
+
+def make_workpad_report_xml( name, workpad_id, descrip=None ):
+    """Generate the XML to create a new report, based on the specified workpad."""
+    return "<channelReport>" \
+             "<name> {} </name>" \
+             "<description> {} </description>" \
+             "<dataSource type='workpad'>" \
+               "<workpad id='{}'/>" \
+             "</dataSource>" \
+           "</channelReport>".format(
+               safe_xml_string(name), safe_xml_string(descrip), safe_xml_string(workpad_id)
+           )
+
+def make_workpad_xml( name, descrip=None ):
+    """Generate the XML to create a new workpad."""
+    return "<workpad>" \
+             "<name> {} </name>" \
+             "<description> {} </description>" \
+           "</workpad>".format(
+               safe_xml_string(name), safe_xml_string(descrip)
+           )
+
+def make_workpad_item_args( workpad_ids, url, title=None, custom_fields=None ):
+    """Generate the API arguments to add a new item to the specified workpads."""
+    api_args = { "url": url, "title": title, "format": "json" }
+    if custom_fields:
+        api_args.update( custom_fields )
+    return add_ids_to_api_args( api_args, workpad_ids )
+
+def make_search_query_args( query_string, search_locs=None, results_fmt="excerpt", adv_syntax=False, page_no=1, page_size=10 ): #pylint: disable=line-too-long,too-many-arguments
+    """Generate the API arguments to run the specified search query."""
+    api_args = {
+        "query": query_string,
+        "fidf": results_fmt,
+        "advsyn": adv_syntax,
+        "page": page_no,
+        "pageSize": page_size,
+        "format": "json"
+    }
+    if search_locs:
+        api_args["locations"] = ",".join(search_locs) if isinstance(search_locs,list) else search_locs
+    return api_args
+
+def get_search_result_items( search_results ):
+    """Extract the list of matching items from a page of search results."""
+    if isinstance( search_results, list ):
+        return search_results
+    # NOTE: The results are returned alongside other information about the search (e.g. the query that was run),
+    # so we look for the (only) list in the response.
+    for val in search_results.values():
+        if isinstance( val, list ):
+            return val
+    return []
+
+# ---------------------------------------------------------------------
+
 def add_ids_to_api_args( api_args, ids ):
     """Add the specified ID's to the argument list."""
     if isinstance( ids, list ):
@@ -0,0 +1,392 @@
+""" Provides asyncio-based access to the Awasu API.
+
+https://awasu.com/api
+"""
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import asyncio
+import time
+
+try:
+    from httplib import parse_headers
+except ImportError:
+    from http.client import parse_headers
+from io import BytesIO
+
+from awasu_api.api import AwasuApi, AwasuApiException, urllib_error, \
+    make_api_request, parse_response_headers, read_response_body, check_response_body, \
+    check_item_statuses, check_workpad_feed, is_no_workpads_error, \
+    make_channel_folder_args, make_channel_by_url_xml, make_plugin_channel_xml, make_search_channel_xml, \
+    make_channel_filter_report_xml, make_channel_folders_report_xml, make_workpad_report_xml, \
+    make_workpad_xml, make_workpad_item_args, make_search_query_args, add_ids_to_api_args
+from awasu_api.connection import ConnectionPool, split_url
+
+# ---------------------------------------------------------------------
+
+class AsyncAwasuApi: #pylint: disable=too-many-public-methods
+    """Provides asyncio-based access to the Awasu API.
+
+    This mirrors AwasuApi, except that every method is a coroutine, so many calls
+    can be in flight at once on a single thread e.g.
+        async with AsyncAwasuApi() as api:
+            stats, channels = await asyncio.gather( api.get_awasu_stats(), api.get_channels() )
+    """
+
+    DEFAULT_API_URL = AwasuApi.DEFAULT_API_URL
+
+    def __init__( self, url=None, token=None, pool_size=None, idle_timeout=None, max_response_size=None ): #pylint: disable=too-many-arguments
+        self.api_url = url if url else AsyncAwasuApi.DEFAULT_API_URL
+        self.api_token = token
+        self.max_response_size = max_response_size
+        self.pool_size = pool_size if pool_size is not None else ConnectionPool.DEFAULT_MAX_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else ConnectionPool.DEFAULT_IDLE_TIMEOUT
+        self._idle_conns = {} # nb: (scheme,host,port) => list of (reader,writer,time-released)
+
+    async def call_api( self, api_name, api_args=None, post_data=None, raw=False, return_headers=False ): #pylint: disable=too-many-arguments
+        """This is the main entry point for calling the Awasu API (see AwasuApi.call_api())."""
+        # initialize the API arguments
+        if not api_args:
+            api_args = {}
+        url, post_data, req_hdrs = make_api_request( self.api_url, self.api_token, api_name, api_args, post_data )
+        # send the request
+        status, reason, msg, body = await self._send_request(
+            "POST" if post_data else "GET", url, post_data, req_hdrs
+        )
+        if status >= 400:
+            raise urllib_error.HTTPError( url, status, reason, msg, BytesIO(body) )
+        # return the response
+        hdrs_dict = parse_response_headers( msg )
+        body = read_response_body( BytesIO(body), hdrs_dict, api_args, raw, None, self.max_response_size )
+        return ( hdrs_dict, body ) if return_headers else body
+
+    async def get_awasu_build_info( self ):
+        """Get the Awasu build info."""
+        return ( await self.call_api_and_check( "buildInfo", {"format":"json"} ) )[ "buildInfo" ]
+
+    async def get_awasu_user_info( self ):
+        """Get the Awasu user info."""
+        return ( await self.call_api_and_check( "userInfo", {"format":"json"} ) )[ "userInfo" ]
+
+    async def get_awasu_stats( self ):
+        """Get the Awasu stats."""
+        return ( await self.call_api_and_check( "stats", {"format":"json"} ) )[ "stats" ]
+
+    async def get_awasu_activity_log( self, nLines=None ):
+        """Get the Awasu Activity log."""
+        return await self.call_api_and_check( "logs/activity", {"lines":nLines}, None, True )
+
+    async def get_awasu_error_log( self, nLines=None ):
+        """Get the Awasu Error log."""
+        return await self.call_api_and_check( "logs/error", {"lines":nLines}, None, True )
+
+    async def get_channel_folders( self, tree=True ):
+        """Get the channel folders."""
+        if tree:
+            return ( await self.call_api_and_check( "channels/folders/tree", {"format":"json"} ) )[ "channelFolder" ]
+        else:
+            return ( await self.call_api_and_check( "channels/folders/list", {"format":"json"} ) )[ "channelFolders" ]
+
+    async def create_channel_folder( self, folderName, parent_folder=None, insert_after=None ):
+        """Create a new channel folder."""
+        api_args = make_channel_folder_args( folderName, parent_folder, insert_after )
+        return ( await self.call_api_and_check( "channels/folders/create", api_args ) )["status"]["id"]
+
+    async def delete_channel_folder( self, id ): #pylint: disable=redefined-builtin
+        """Delete a channel folder."""
+        await self.call_api_and_check( "channels/folders/delete", {"id":id,"format":"json"} )
+
+    async def get_channel_filters( self ):
+        """Get the channel filters."""
+        return ( await self.call_api_and_check( "channels/filters/list", {"format":"json"} ) )[ "channelFilters" ]
+
+    async def get_channels( self, ids=None, verbose=False ):
+        """Get the configuration details for the specified channels."""
+        api_args = { "format": "json", "verbose": verbose }
+        api_args = add_ids_to_api_args( api_args, ids )
+        return ( await self.call_api_and_check( "channels/list", api_args ) )[ "channels" ]
+
+    async def get_channel_stats( self, ids=None ):
+        """Get the statistics for the specified channels."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        return ( await self.call_api_and_check( "channels/stats", api_args ) )[ "channels" ]
+
+    async def get_channel_errors( self, ids=None ):
+        """Get the error log for the specified channels."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        return ( await self.call_api_and_check( "channels/errors", api_args ) )[ "channels" ]
+
+    async def get_channel_summary( self, id ): #pylint: disable=redefined-builtin
+        """Get the summary for the specified channel."""
+        if isinstance( id, list ):
+            raise AwasuApiException( "Can't get multiple channels." )
+        return await self.call_api_and_check( "channels/get", {"id":id,"format":"html"} )
+
+    async def create_channel( self, post_data ):
+        """Create a new channel."""
+        resp = await self.call_api_and_check( "channels/create", {"format":"json"}, post_data )
+        return int( resp["status"]["id"] )
+    async def create_channel_by_url( self, url ):
+        """Create a new channel (downloaded from the specified URL)."""
+        return await self.create_channel( make_channel_by_url_xml( url ) )
+    async def create_plugin_channel( self, plugin_path, plugin_params ):
+        """Create a new plugin channel."""
+        return await self.create_channel( make_plugin_channel_xml( plugin_path, plugin_params ) )
+    async def create_search_channel( self, query_string, search_locs=None, adv_syntax=False ):
+        """Create a new search channel."""
+        return await self.create_channel( make_search_channel_xml( query_string, search_locs, adv_syntax ) )
+
+    async def delete_channels( self, ids ):
+        """Delete the specified channels."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        resp = await self.call_api_and_check( "channels/delete", api_args )
+        check_item_statuses( resp["channels"], "Can't delete channel \"{name}\" ({id}): {status}" )
+
+    async def get_reports( self, ids=None, verbose=False ):
+        """Get the configuration details for the specified reports."""
+        api_args = { "format": "json", "verbose": verbose }
+        api_args = add_ids_to_api_args( api_args, ids )
+        return ( await self.call_api_and_check( "reports/list", api_args ) )[ "channelReports" ]
+
+    async def run_reports( self, ids ):
+        """Run the specified reports."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        resp = await self.call_api_and_check( "reports/run", api_args )
+        check_item_statuses( resp["channelReports"], "Can't run report \"{name}\" ({id}): {status}" )
+
+    async def get_report( self, id ): #pylint: disable=redefined-builtin
+        """Run the specified report and return the result."""
+        if isinstance( id, list ):
+            raise AwasuApiException( "Can't get multiple reports." )
+        return await self.call_api_and_check( "reports/get", {"id":id,"format":"html"} )
+
+    async def create_report( self, post_data ):
+        """Create a new report."""
+        resp = await self.call_api_and_check( "reports/create", {"format":"json"}, post_data )
+        return resp["status"]["id"]
+    async def create_channel_filter_report( self, name, cf_name, descrip=None ):
+        """Create a new report, based on the specified channel filter."""
+        return await self.create_report( make_channel_filter_report_xml( name, cf_name, descrip ) )
+    async def create_channel_folders_report( self, name, cf_ids, include_subfolders, descrip=None ):
+        """Create a new report, based on the specified channel folders."""
+        return await self.create_report( make_channel_folders_report_xml( name, cf_ids, include_subfolders, descrip ) )
+    async def create_workpad_report( self, name, workpad_id, descrip=None ):
+        """Create a new report, based on the specified workpad."""
+        return await self.create_report( make_workpad_report_xml( name, workpad_id, descrip ) )
+
+    async def delete_reports( self, ids ):
+        """Delete the specified reports."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        resp = await self.call_api_and_check( "reports/delete", api_args )
+        check_item_statuses( resp["channelReports"], "Can't delete report \"{name}\" ({id}): {status}" )
+
+    async def get_workpads( self, ids=None ):
+        """Get the configuration details for the specified workpads."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        return ( await self.call_api_and_check( "workpads/list", api_args ) )[ "workpads" ]
+
+    async def get_workpad( self, id ): #pylint: disable=redefined-builtin
+        """Get the contents of the specified workpad."""
+        if isinstance( id, list ):
+            raise AwasuApiException("Can't get multiple workpads.")
+        return ( await self.call_api_and_check( "workpads/get", {"id":id,"format":"json"} ) )[ "workpad" ]
+
+    async def get_default_workpad( self ):
+        """Get the default workpad."""
+        try:
+            return await self.get_workpad( "@" )
+        except AwasuApiException as xcptn:
+            if is_no_workpads_error( xcptn ):
+                return None
+            raise
+
+    async def get_workpad_feed( self, id ): #pylint: disable=redefined-builtin
+        """Get the feed XML for the specified workpad."""
+        xml = await self.call_api_and_check( "workpads/feed", {"id":id} )
+        return check_workpad_feed( xml )
+
+    async def add_workpad_item( self, workpad_ids, url, title=None, custom_fields=None ):
+        """Add a new item to the specified workpads."""
+        api_args = make_workpad_item_args( workpad_ids, url, title, custom_fields )
+        resp = await self.call_api_and_check( "workpads/addItem", api_args )
+        check_item_statuses( resp["workpads"], "Can't add item to workpad \"{name}\" ({id}): {status}" )
+
+    async def create_workpad( self, name, descrip=None ):
+        """Create a new workpad."""
+        post_data = make_workpad_xml( name, descrip )
+        resp = await self.call_api_and_check( "workpads/create", {"format":"json"}, post_data )
+        return resp["status"]["id"]
+
+    async def delete_workpads( self, ids ):
+        """Delete the specified workpads."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        resp = await self.call_api_and_check( "workpads/delete", api_args )
+        check_item_statuses( resp["workpads"], "Can't delete workpad \"{name}\" ({id}): {status}" )
+
+    async def get_feed_items( self, ids=None ):
+        """Get the specified feed items."""
+        api_args = add_ids_to_api_args( {"format":"json"}, ids )
+        return ( await self.call_api_and_check( "feedItems/get", api_args ) )[ "feedItems" ]
+
+    async def run_search_query( self, query_string, search_locs=None, results_fmt="excerpt", adv_syntax=False, page_no=1, page_size=10 ): #pylint: disable=line-too-long,too-many-arguments
+        """Run the specified search query."""
+        api_args = make_search_query_args( query_string, search_locs, results_fmt, adv_syntax, page_no, page_size )
+        return ( await self.call_api_and_check( "search/query", api_args ) )[ "searchResults" ]
+
+    async def call_api_and_check( self, api_name, api_args=None, post_data=None, raw=False ):
+        """Call the Awasu API and check for errors."""
+        if api_args is None:
+            api_args = {}
+        api_args["quiet"] = False
+        response = await self.call_api( api_name, api_args, post_data, raw, True )
+        if not raw:
+            check_response_body( response[1], api_args )
+        return response[1]
+
+    async def close( self ):
+        """Close any open connections to Awasu."""
+        idle_conns, self._idle_conns = self._idle_conns, {}
+        for conns in idle_conns.values():
+            for _, writer, _ in conns:
+                writer.close()
+
+    async def __aenter__( self ):
+        return self
+
+    async def __aexit__( self, exc_type, exc_val, exc_tb ):
+        await self.close()
+
+    async def _send_request( self, method, url, body, hdrs ):
+        """Send an HTTP request, and return the response."""
+        key, path = split_url( url )
+        req = _make_request_head( method, key, path, body, hdrs )
+        if body:
+            req += body
+        retried = False
+        while True:
+            reader, writer, is_reused = await self._get_conn( key )
+            try:
+                writer.write( req )
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError( "Connection closed by Awasu." )
+            except (ConnectionResetError, BrokenPipeError):
+                writer.close()
+                # NOTE: If Awasu closed an idle connection, we only find out when we try to use it,
+                # so we retry (once) with another connection. Nothing else is retried, since Awasu calls
+                # are POST's, and re-sending a request that Awasu may have acted on is not safe.
+                if is_reused and not retried:
+                    retried = True
+                    continue
+                raise
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+                raise
+            break
+        # read the response
+        try:
+            status, reason, msg, resp_body, will_close = await _read_response( reader, status_line, method )
+        except:
+            writer.close()
+            raise
+        # return the connection to the pool
+        conns = self._idle_conns.setdefault( key, [] )
+        if will_close or len(conns) >= self.pool_size:
+            writer.close()
+        else:
+            conns.append( ( reader, writer, time.time() ) )
+        return status, reason, msg, resp_body
+
+    async def _get_conn( self, key ):
+        """Get a connection from the pool, or open a new one."""
+        conns = self._idle_conns.get( key )
+        # evict connections that have been idle for too long
+        now = time.time()
+        while conns and now - conns[0][2] > self.idle_timeout:
+            conns.pop( 0 )[1].close()
+        if conns:
+            reader, writer, _ = conns.pop()
+            return reader, writer, True
+        # open a new connection
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection( host, port, ssl=True if scheme == "https" else None )
+        return reader, writer, False
+
+    def __str__( self ):
+        return "AsyncAwasuApi @ {}".format( self.api_url )
+
+# ---------------------------------------------------------------------
+
+def _make_request_head( method, key, path, body, hdrs ):
+    """Generate the request line and headers for an HTTP request."""
+    scheme, host, port = key
+    host_hdr = host if port == ( 443 if scheme == "https" else 80 ) else "{}:{}".format( host, port )
+    lines = [ "{} {} HTTP/1.1".format( method, path ), "Host: {}".format( host_hdr ) ]
+    lines.append( "Content-Length: {}".format( len(body) if body else 0 ) )
+    lines.extend( "{}: {}".format( key, val ) for key, val in hdrs.items() )
+    return ( "\r\n".join( lines ) + "\r\n\r\n" ).encode( "latin-1" )
+
+async def _read_response( reader, status_line, method ):
+    """Read an HTTP response."""
+    # parse the status line
+    parts = status_line.decode( "latin-1" ).rstrip( "\r\n" ).split( None, 2 )
+    if len(parts) < 2 or not parts[0].startswith( "HTTP/" ):
+        raise ConnectionError( "Invalid HTTP status line: {}".format( status_line ) )
+    version, status, reason = parts[0], int( parts[1] ), parts[2] if len(parts) > 2 else ""
+    # read the headers
+    hdr_lines = []
+    while True:
+        line = await reader.readline()
+        hdr_lines.append( line )
+        if line in ( b"\r\n", b"\n", b"" ):
+            break
+    msg = parse_headers( BytesIO( b"".join( hdr_lines ) ) )
+    conn_hdr = ( msg.get( "Connection" ) or "" ).lower()
+    will_close = conn_hdr == "close" or ( version == "HTTP/1.0" and conn_hdr != "keep-alive" )
+    # read the response body
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        body = b""
+    elif ( msg.get( "Transfer-Encoding" ) or "" ).lower() == "chunked":
+        chunks = []
+        while True:
+            chunk_size = int( ( await reader.readline() ).split( b";" )[0], 16 )
+            if chunk_size == 0:
+                break
+            chunks.append( await reader.readexactly( chunk_size ) )
+            await reader.readline()
+        # nb: skip any trailers
+        while ( await reader.readline() ) not in ( b"\r\n", b"\n", b"" ):
+            pass
+        body = b"".join( chunks )
+    elif msg.get( "Content-Length" ) is not None:
+        body = await reader.readexactly( int( msg["Content-Length"] ) )
+    else:
+        body = await reader.read()
+        will_close = True
+    return status, reason, msg, body, will_close
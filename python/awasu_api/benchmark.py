@@ -0,0 +1,416 @@
+""" Benchmarks the overhead of the awasu_api client, using a local stand-in for Awasu.
+"""
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import sys
+import os
+import threading
+import time
+import tracemalloc
+import json
+import zlib
+import re
+import getopt
+import subprocess
+from xml.etree import ElementTree
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+try:
+    from urlparse import urlsplit
+except ImportError:
+    from urllib.parse import urlsplit
+
+from awasu_api.api import AwasuApi
+from awasu_api.utils import safe_xml_string
+
+# ---------------------------------------------------------------------
+
+class FakeAwasuServer( ThreadingMixIn, HTTPServer ): #pylint: disable=too-many-instance-attributes
+    """A local HTTP server that emulates (a few of) the Awasu API endpoints.
+
+    The size of the responses can be configured, so that the client's overhead can be measured
+    for small and large responses. Responses are generated once, and then cached, so that
+    the server itself does as little work as possible while it's being benchmarked.
+    """
+
+    daemon_threads = True
+
+    def __init__( self, n_channels=1000, n_feed_items=1000, n_search_results=1000, item_size=500, deflate=True ): #pylint: disable=too-many-arguments
+        super().__init__( ( "127.0.0.1", 0 ), _FakeAwasuRequestHandler )
+        self.n_channels = n_channels
+        self.n_feed_items = n_feed_items
+        self.n_search_results = n_search_results
+        self.item_size = item_size
+        self.deflate = deflate
+        self._resp_cache = {}
+        self._resp_cache_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url( self ):
+        """The URL for the server."""
+        return "http://{}:{}".format( *self.server_address )
+
+    def start( self ):
+        """Start the server (in a background thread)."""
+        self._thread = threading.Thread( target=self.serve_forever, daemon=True )
+        self._thread.start()
+        return self
+
+    def stop( self ):
+        """Stop the server."""
+        self.shutdown()
+        self.server_close()
+
+    def get_response( self, api_name, api_args ):
+        """Get the response for an API call (as a tuple of (content type, body))."""
+        key = ( api_name, tuple( sorted( api_args.items() ) ) )
+        with self._resp_cache_lock:
+            resp = self._resp_cache.get( key )
+        if resp is None:
+            resp = self._make_response( api_name, api_args )
+            if resp and self.deflate:
+                compressor = zlib.compressobj( 6, zlib.DEFLATED, -zlib.MAX_WBITS )
+                resp = ( resp[0], compressor.compress( resp[1] ) + compressor.flush() )
+            with self._resp_cache_lock:
+                self._resp_cache[ key ] = resp
+        return resp
+
+    def _make_response( self, api_name, api_args ): #pylint: disable=too-many-return-statements
+        """Generate the response for an API call."""
+        fmt = api_args.get( "format", "xml" )
+        ids = [ int(x) for x in api_args["id"].split(",") ] if re.search( "^[0-9,]+$", api_args.get("id","") ) else None
+        if api_name == "stats":
+            return _make_json_response( { "stats": {
+                "nChannels": self.n_channels, "nFeedItems": self.n_feed_items, "nErrors": 0
+            } } )
+        if api_name == "channels/list":
+            channels = [ self._make_channel( i, api_args.get( "verbose" ) in ("1","True","true") ) \
+                for i in ( ids if ids else range( self.n_channels ) ) ]
+            if fmt == "json":
+                return _make_json_response( { "channels": channels } )
+            return _make_xml_response( "channels", "channel", channels )
+        if api_name == "feedItems/get":
+            feed_items = [ self._make_feed_item( i ) for i in ( ids if ids else range( self.n_feed_items ) ) ]
+            return _make_json_response( { "feedItems": feed_items } )
+        if api_name == "search/query":
+            page_no, page_size = int( api_args.get( "page", 1 ) ), int( api_args.get( "pageSize", 10 ) )
+            first = ( page_no - 1 ) * page_size
+            items = [ self._make_feed_item( i ) for i in range( first, min( first+page_size, self.n_search_results ) ) ]
+            return _make_json_response( { "searchResults": {
+                "query": api_args.get( "query" ), "resultItems": items
+            } } )
+        if api_name == "workpads/feed":
+            buf = [ "<rss version='2.0'><channel><title>Workpad</title>" ]
+            for i in range( self.n_feed_items ):
+                feed_item = self._make_feed_item( i )
+                buf.append( "<item><title>{}</title><link>{}</link><description>{}</description></item>".format(
+                    safe_xml_string( feed_item["title"] ), safe_xml_string( feed_item["url"] ),
+                    safe_xml_string( feed_item["description"] )
+                ) )
+            buf.append( "</channel></rss>" )
+            return ( "text/xml", "".join( buf ).encode( "utf-8" ) )
+        return None
+
+    def _make_channel( self, channel_id, verbose ):
+        """Generate the details for a channel."""
+        channel = {
+            "id": channel_id,
+            "name": "Channel {}".format( channel_id ),
+            "feedUrl": "http://example.com/feeds/{}.xml".format( channel_id ),
+        }
+        if verbose:
+            channel.update( {
+                "folder": "Folder {}".format( channel_id % 10 ),
+                "status": "OK",
+                "description": "x" * self.item_size,
+            } )
+        return channel
+
+    def _make_feed_item( self, item_id ):
+        """Generate the details for a feed item."""
+        return {
+            "id": item_id,
+            "title": "Feed item {}".format( item_id ),
+            "url": "http://example.com/items/{}.html".format( item_id ),
+            "description": "x" * self.item_size,
+        }
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class _FakeAwasuRequestHandler( BaseHTTPRequestHandler ):
+    """Handles requests sent to the FakeAwasuServer."""
+
+    protocol_version = "HTTP/1.1" # nb: so that connections are kept alive
+    disable_nagle_algorithm = True # nb: the headers and body are sent separately
+
+    def do_GET( self ): #pylint: disable=invalid-name
+        """Handle a GET request."""
+        self._handle_request( None )
+
+    def do_POST( self ): #pylint: disable=invalid-name
+        """Handle a POST request."""
+        self._handle_request( self.rfile.read( int( self.headers.get( "Content-Length", 0 ) ) ) )
+
+    def _handle_request( self, post_data ):
+        """Handle a request."""
+        # get the API arguments
+        api_name = urlsplit( self.path ).path.lstrip( "/" )
+        api_args = {}
+        if post_data:
+            node = ElementTree.fromstring( post_data )
+            if node.tag != "apiArgs":
+                node = node.find( "apiArgs" )
+            if node is not None:
+                api_args = dict( node.items() )
+        # send the response
+        resp = self.server.get_response( api_name, api_args )
+        if not resp:
+            self.send_error( 404 )
+            return
+        self.send_response( 200 )
+        self.send_header( "Content-Type", resp[0] )
+        if self.server.deflate:
+            self.send_header( "Content-Encoding", "deflate" )
+        self.send_header( "Content-Length", str( len(resp[1]) ) )
+        self.end_headers()
+        self.wfile.write( resp[1] )
+
+    def log_message( self, format, *args ): #pylint: disable=redefined-builtin
+        pass
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _make_json_response( data ):
+    return ( "application/json", json.dumps( data ).encode( "utf-8" ) )
+
+def _make_xml_response( root_tag, item_tag, items ):
+    buf = [ "<{}>".format( root_tag ) ]
+    for item in items:
+        buf.append( "<{}>".format( item_tag ) )
+        for key, val in item.items():
+            buf.append( "<{0}>{1}</{0}>".format( key, safe_xml_string( val ) ) )
+        buf.append( "</{}>".format( item_tag ) )
+    buf.append( "</{}>".format( root_tag ) )
+    return ( "text/xml", "".join( buf ).encode( "utf-8" ) )
+
+# ---------------------------------------------------------------------
+
+# NOTE: Each benchmark is a function that takes an AwasuApi object, and makes one call to Awasu.
+BENCHMARKS = [
+    ( "get_awasu_stats", lambda api: api.get_awasu_stats() ),
+    ( "get_channels", lambda api: api.get_channels() ),
+    ( "get_channels (verbose)", lambda api: api.get_channels( verbose=True ) ),
+    ( "channels/list (xml)", lambda api: api.call_api( "channels/list", {"verbose":True} ) ),
+    ( "iter_channels", lambda api: sum( 1 for _ in api.iter_channels( verbose=True ) ) ),
+    ( "get_feed_items", lambda api: api.get_feed_items() ),
+    ( "get_feed_items (ids)", lambda api: api.get_feed_items( list( range( 1000 ) ) ) ),
+    ( "run_search_query", lambda api: api.run_search_query( "test", page_size=100 ) ),
+    ( "iter_search_results", lambda api: sum( 1 for _ in api.iter_search_results( "test" ) ) ),
+    ( "get_workpad_feed", lambda api: api.get_workpad_feed( "@" ) ),
+    ( "iter_workpad_feed_items", lambda api: sum( 1 for _ in api.iter_workpad_feed_items( "@" ) ) ),
+]
+
+def run_benchmark( api, func, n_calls ):
+    """Run a benchmark, and return the results."""
+    # warm up
+    func( api )
+    # time the calls
+    timings = []
+    start_time = time.perf_counter()
+    for _ in range( n_calls ):
+        call_start_time = time.perf_counter()
+        func( api )
+        timings.append( time.perf_counter() - call_start_time )
+    elapsed_time = time.perf_counter() - start_time
+    # measure peak memory usage
+    # NOTE: We do this separately, since tracing memory allocations slows everything down.
+    tracemalloc.start()
+    try:
+        func( api )
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    return {
+        "p50": _percentile( timings, 50 ),
+        "p90": _percentile( timings, 90 ),
+        "p99": _percentile( timings, 99 ),
+        "calls_per_sec": n_calls / elapsed_time if elapsed_time > 0 else 0,
+        "peak_memory": peak_memory,
+    }
+
+def run_benchmarks( server, n_calls, name_regex=None ):
+    """Run the benchmarks against a FakeAwasuServer, and yield the results."""
+    api = AwasuApi( server.url )
+    try:
+        for name, func in BENCHMARKS:
+            if name_regex and not re.search( name_regex, name ):
+                continue
+            yield name, run_benchmark( api, func, n_calls )
+    finally:
+        api.close()
+
+def _percentile( vals, pct ):
+    # nb: vals must be sorted
+    return vals[ min( len(vals)-1, int( len(vals) * pct / 100 ) ) ]
+
+# ---------------------------------------------------------------------
+
+# NOTE: Short-lived scripts (e.g. the console, run from cron) pay the import time on every run, so we keep
+# an eye on it. These modules are slow to load, and shouldn't be needed just to make an API call.
+IMPORT_TIME_BUDGET = 0.1
+SLOW_MODULES = [ "asyncio", "concurrent.futures", "xml.sax.saxutils", "urllib.request", "http.server" ]
+
+def check_import_time( module_name="awasu_api.console", n_runs=5, budget=None ):
+    """Check how long it takes to import a module (in a fresh Python process).
+
+    Returns the median import time, and a list of problems (if the import took longer than the budget,
+    or loaded any of the SLOW_MODULES).
+    """
+    # NOTE: We only use built-in modules to do the timing, so that we don't pre-load anything.
+    code = "import sys, time ; start_time = time.perf_counter() ; import {} ; " \
+           "print( time.perf_counter() - start_time ) ; print( ' '.join( sys.modules ) )".format( module_name )
+    timings = []
+    for _ in range( max( n_runs, 1 ) ):
+        proc = subprocess.run( [ sys.executable, "-c", code ], stdout=subprocess.PIPE, check=True )
+        lines = proc.stdout.decode( "utf-8" ).splitlines()
+        timings.append( float( lines[0] ) )
+        loaded_modules = set( lines[1].split() )
+    timings.sort()
+    import_time = _percentile( timings, 50 )
+    problems = []
+    if budget is None:
+        budget = IMPORT_TIME_BUDGET
+    if import_time > budget:
+        problems.append( "Importing {} took {:.1f}ms (budget={:.1f}ms).".format(
+            module_name, 1000*import_time, 1000*budget
+        ) )
+    for slow_module in SLOW_MODULES:
+        if slow_module in loaded_modules:
+            problems.append( "Importing {} loaded {}.".format( module_name, slow_module ) )
+    return import_time, problems
+
+# ---------------------------------------------------------------------
+
+def main():
+    """Main processing."""
+
+    # parse the command-line arguments
+    n_calls = 100
+    server_args = {}
+    name_regex = None
+    check_imports = False
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "n:b:?",
+            [ "calls=", "benchmarks=", "channels=", "feed-items=", "search-results=", "item-size=", "no-deflate", "check-imports", "help" ] #pylint: disable=line-too-long
+        )
+    except getopt.GetoptError as err:
+        raise Exception( "Can't parse arguments: {}".format( err ) ) from err
+    for opt,val in opts:
+        if opt in ("-?", "--help"):
+            print_help()
+            sys.exit()
+        elif opt in ("-n", "--calls"):
+            n_calls = int( val )
+        elif opt in ("-b", "--benchmarks"):
+            name_regex = val
+        elif opt == "--channels":
+            server_args["n_channels"] = int( val )
+        elif opt == "--feed-items":
+            server_args["n_feed_items"] = int( val )
+        elif opt == "--search-results":
+            server_args["n_search_results"] = int( val )
+        elif opt == "--item-size":
+            server_args["item_size"] = int( val )
+        elif opt == "--no-deflate":
+            server_args["deflate"] = False
+        elif opt == "--check-imports":
+            check_imports = True
+        else:
+            raise Exception( "Invalid command line option: {}".format( opt ) )
+    if args:
+        print_help()
+        sys.exit()
+
+    # check the import time
+    if check_imports:
+        import_time, problems = check_import_time()
+        print( "Import time: {:.1f}ms".format( 1000 * import_time ) )
+        for problem in problems:
+            print( "- {}".format( problem ) )
+        sys.exit( 1 if problems else 0 )
+
+    # run the benchmarks
+    server = FakeAwasuServer( **server_args ).start()
+    try:
+        fmt = "{:<28} {:>10} {:>10} {:>10} {:>10} {:>12}"
+        print( fmt.format( "", "p50 (ms)", "p90 (ms)", "p99 (ms)", "calls/sec", "peak mem (K)" ) )
+        for name, results in run_benchmarks( server, n_calls, name_regex ):
+            print( fmt.format(
+                name,
+                "{:.2f}".format( 1000 * results["p50"] ),
+                "{:.2f}".format( 1000 * results["p90"] ),
+                "{:.2f}".format( 1000 * results["p99"] ),
+                "{:.1f}".format( results["calls_per_sec"] ),
+                "{:.1f}".format( results["peak_memory"] / 1024 ),
+            ) )
+    finally:
+        server.stop()
+
+# ---------------------------------------------------------------------
+
+def print_help():
+    """Print help."""
+    script_name = os.path.split(sys.argv[0])[ 1 ]
+    print( "{} [options]".format( script_name ) )
+    print( "  Benchmarks the awasu_api client against a local stand-in for Awasu." )
+    print( "" )
+    print( "Options:" )
+    print( "  -n --calls            Number of calls to make for each benchmark (default=100)." )
+    print( "  -b --benchmarks       Only run benchmarks whose name matches this regex." )
+    print( "     --channels         Number of channels the server returns (default=1000)." )
+    print( "     --feed-items       Number of feed items the server returns (default=1000)." )
+    print( "     --search-results   Number of search results the server returns (default=1000)." )
+    print( "     --item-size        Size of each channel description/feed item (default=500)." )
+    print( "     --no-deflate       Don't compress responses." )
+    print( "     --check-imports    Check the import time, instead of running the benchmarks." )
+    print( "                          Exits with an error if it's over budget, or slow modules are loaded." )
+
+# ---------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+""" Caches responses from the Awasu API.
+"""
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import threading
+import collections
+import time
+
+# ---------------------------------------------------------------------
+
+class ResponseCache: #pylint: disable=too-many-instance-attributes
+    """Caches responses from read-only API endpoints.
+
+    Responses are cached per (Awasu instance, API token, API name, arguments), so a cache can be shared
+    between multiple AwasuApi objects, and expire after a per-endpoint TTL. Endpoints that don't have a TTL
+    are never cached. When an API call is made that changes Awasu's configuration (e.g. creating or deleting
+    a channel), any cached responses that might be affected are discarded.
+    """
+
+    DEFAULT_MAX_SIZE = 256
+
+    # NOTE: These are the endpoints that get cached, and how long their responses are kept (in seconds).
+    DEFAULT_TTLS = {
+        "buildInfo": 3600,
+        "userInfo": 300,
+        "channels/folders/tree": 60,
+        "channels/folders/list": 60,
+        "channels/filters/list": 60,
+        "channels/list": 60,
+        "reports/list": 60,
+        "workpads/list": 60,
+    }
+
+    # NOTE: Calling one of these endpoints will discard cached responses from the endpoints that start with
+    # any of the listed prefixes.
+    INVALIDATIONS = {
+        "channels/create": ( "channels/list", "channels/folders/", "channels/filters/" ),
+        "channels/update": ( "channels/list", "channels/folders/", "channels/filters/" ),
+        "channels/delete": ( "channels/list", "channels/folders/", "channels/filters/" ),
+        "channels/folders/create": ( "channels/list", "channels/folders/" ),
+        "channels/folders/delete": ( "channels/list", "channels/folders/" ),
+        "reports/create": ( "reports/list", ),
+        "reports/update": ( "reports/list", ),
+        "reports/delete": ( "reports/list", ),
+        "workpads/create": ( "workpads/list", ),
+        "workpads/update": ( "workpads/list", ),
+        "workpads/delete": ( "workpads/list", ),
+        "workpads/addItem": ( "workpads/list", ),
+    }
+
+    def __init__( self, max_size=None, ttls=None ):
+        self.max_size = max_size if max_size is not None else ResponseCache.DEFAULT_MAX_SIZE
+        self.ttls = dict( ResponseCache.DEFAULT_TTLS )
+        if ttls:
+            self.ttls.update( ttls )
+        self.hits = self.misses = self.evictions = 0
+        self._entries = collections.OrderedDict() # nb: key => (api_name,expiry-time,val)
+        self._generation = 0
+        self._invalidations = {} # nb: prefix => generation when it was last invalidated
+        self._lock = threading.Lock()
+
+    def make_key( self, api_url, api_token, api_name, api_args, raw ): #pylint: disable=too-many-arguments
+        """Generate the cache key for an API call (or None, if it shouldn't be cached)."""
+        if not self.ttls.get( api_name ):
+            return None
+        # NOTE: The API token doesn't change a successful response, but we include it in the key,
+        # so that a call with a bad token gets an error from Awasu, not someone else's cached response.
+        api_args = tuple( sorted(
+            ( key, str(val) ) for key, val in api_args.items() if key != "token"
+        ) )
+        return ( api_name, api_url, api_token, api_args, bool(raw) )
+
+    @property
+    def generation( self ):
+        """The current generation (this should be passed to put() when the response arrives)."""
+        with self._lock:
+            return self._generation
+
+    def get( self, key ):
+        """Get a cached response (or None, if it's not available)."""
+        with self._lock:
+            entry = self._entries.get( key )
+            if entry and entry[1] < time.time():
+                # nb: the entry has expired
+                del self._entries[ key ]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end( key )
+            return entry[2]
+
+    def put( self, key, val, generation=None ):
+        """Save a response in the cache.
+
+        If the generation when the API call was started is given, and a change that might affect
+        the response was made since then, the response is not cached.
+        """
+        api_name = key[0]
+        with self._lock:
+            if generation is not None:
+                # NOTE: The response may have been generated before the change was made, and so might be out-of-date.
+                for prefix, invalidated in self._invalidations.items():
+                    if invalidated > generation and api_name.startswith( prefix ):
+                        return
+            self._entries[ key ] = ( api_name, time.time() + self.ttls[api_name], val )
+            self._entries.move_to_end( key )
+            while len(self._entries) > self.max_size:
+                self._entries.popitem( last=False )
+                self.evictions += 1
+
+    def invalidate( self, api_name ):
+        """Discard any cached responses that might be affected by a call to the specified endpoint."""
+        prefixes = ResponseCache.INVALIDATIONS.get( api_name )
+        if not prefixes:
+            return
+        with self._lock:
+            self._generation += 1
+            for prefix in prefixes:
+                self._invalidations[ prefix ] = self._generation
+            keys = [ key for key, entry in self._entries.items() if entry[0].startswith( prefixes ) ]
+            for key in keys:
+                del self._entries[ key ]
+
+    def clear( self ):
+        """Discard all cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__( self ):
+        return len( self._entries )
+
+    def __str__( self ):
+        return "ResponseCache: size={} ; hits={} ; misses={} ; evictions={}".format(
+            len(self._entries), self.hits, self.misses, self.evictions
+        )
@@ -0,0 +1,188 @@
+""" Provides access to multiple Awasu instances.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import zlib
+
+from awasu_api.api import AwasuApi, get_search_result_items
+from awasu_api.utils import run_concurrently
+
+# ---------------------------------------------------------------------
+
+class AwasuCluster:
+    """Provides access to multiple Awasu instances, as if they were one.
+
+    Read calls are sent to every instance in parallel (so they take as long as the slowest instance,
+    not the sum of them all), and the results merged, with each result tagged with the name of the instance
+    it came from (in its SOURCE_KEY field). Calls that change something are sent to one instance,
+    chosen by a routing function, or the caller.
+    """
+
+    SOURCE_KEY = "awasuInstance"
+
+    def __init__( self, apis, router=None ):
+        # NOTE: Instances can be passed in as a dict of name => AwasuApi (or URL), or a list of AwasuApi objects
+        # (or URL's), in which case, they are named by URL.
+        if isinstance( apis, dict ):
+            self.apis = { name: _make_api( api ) for name, api in apis.items() }
+        else:
+            apis = [ _make_api( api ) for api in apis ]
+            self.apis = { api.api_url: api for api in apis }
+        if not self.apis:
+            raise ValueError( "No Awasu instances were specified." )
+        # nb: the routing function is called with the instance names, the API name and the call's arguments,
+        # and returns the name of the instance to send the call to
+        self.router = router or route_to_first
+
+    def call_all( self, func ):
+        """Call a function for every instance in parallel, and return a dict of instance name => result.
+
+        The function is passed the instance's AwasuApi object. If the call fails for an instance,
+        its exception is returned in place of its result.
+        """
+        names = list( self.apis.keys() )
+        results = run_concurrently( lambda name: func( self.apis[name] ), names, len(names) )
+        return dict( zip( names, results ) )
+
+    def get_awasu_stats( self ):
+        """Get the Awasu stats for every instance, as a dict of instance name => stats."""
+        return self._call_all_and_check( lambda api: api.get_awasu_stats() )
+
+    def get_channels( self, ids=None, verbose=False ):
+        """Get the configuration details for the specified channels, from every instance."""
+        return self._merge_lists( lambda api: api.get_channels( ids, verbose ) )
+
+    def get_reports( self, ids=None, verbose=False ):
+        """Get the configuration details for the specified reports, from every instance."""
+        return self._merge_lists( lambda api: api.get_reports( ids, verbose ) )
+
+    def get_workpads( self, ids=None ):
+        """Get the configuration details for the specified workpads, from every instance."""
+        return self._merge_lists( lambda api: api.get_workpads( ids ) )
+
+    def run_search_query( self, query_string, search_locs=None, results_fmt="excerpt", adv_syntax=False, page_no=1, page_size=10 ): #pylint: disable=line-too-long,too-many-arguments
+        """Run the specified search query on every instance, and return the matching items."""
+        return self._merge_lists( lambda api: get_search_result_items(
+            api.run_search_query( query_string, search_locs, results_fmt, adv_syntax, page_no, page_size )
+        ) )
+
+    def create_channel( self, post_data, instance=None ):
+        """Create a new channel, and return a tuple of (instance name, channel ID)."""
+        return self._route_call( "channels/create", post_data, instance, lambda api: api.create_channel( post_data ) )
+
+    def create_channel_by_url( self, url, instance=None ):
+        """Create a new channel (downloaded from the specified URL)."""
+        return self._route_call( "channels/create", url, instance, lambda api: api.create_channel_by_url( url ) )
+
+    def create_report( self, post_data, instance=None ):
+        """Create a new report, and return a tuple of (instance name, report ID)."""
+        return self._route_call( "reports/create", post_data, instance, lambda api: api.create_report( post_data ) )
+
+    def create_workpad( self, name, descrip=None, instance=None ):
+        """Create a new workpad, and return a tuple of (instance name, workpad ID)."""
+        return self._route_call( "workpads/create", name, instance, lambda api: api.create_workpad( name, descrip ) )
+
+    def delete_channels( self, channels ):
+        """Delete the specified channels (as returned by get_channels())."""
+        self._delete_items( channels, lambda api, ids: api.delete_channels( ids ) )
+
+    def delete_reports( self, reports ):
+        """Delete the specified reports (as returned by get_reports())."""
+        self._delete_items( reports, lambda api, ids: api.delete_reports( ids ) )
+
+    def delete_workpads( self, workpads ):
+        """Delete the specified workpads (as returned by get_workpads())."""
+        self._delete_items( workpads, lambda api, ids: api.delete_workpads( ids ) )
+
+    def close( self ):
+        """Close any open connections to Awasu."""
+        for api in self.apis.values():
+            api.close()
+
+    def _call_all_and_check( self, func ):
+        """Call a function for every instance in parallel, and raise the first error (if any)."""
+        results = self.call_all( func )
+        for result in results.values():
+            if isinstance( result, Exception ):
+                raise result
+        return results
+
+    def _merge_lists( self, func ):
+        """Call a function that returns a list for every instance, and merge the results."""
+        merged = []
+        for name, items in self._call_all_and_check( func ).items():
+            for item in items:
+                item[ AwasuCluster.SOURCE_KEY ] = name
+            merged.extend( items )
+        return merged
+
+    def _route_call( self, api_name, args, instance, func ):
+        """Send a call to one instance (chosen by the router, if not specified)."""
+        if instance is None:
+            instance = self.router( list( self.apis.keys() ), api_name, args )
+        return instance, func( self.apis[ instance ] )
+
+    def _delete_items( self, items, func ):
+        """Delete items, on the instances they came from."""
+        # group the items by instance
+        ids = {}
+        for item in items:
+            ids.setdefault( item[ AwasuCluster.SOURCE_KEY ], [] ).append( item["id"] )
+        # delete the items
+        results = run_concurrently( lambda name: func( self.apis[name], ids[name] ), list( ids.keys() ), len(ids) or 1 )
+        for result in results:
+            if isinstance( result, Exception ):
+                raise result
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        self.close()
+
+    def __str__( self ):
+        return "AwasuCluster: {}".format( ", ".join( self.apis.keys() ) )
+
+# ---------------------------------------------------------------------
+
+def _make_api( api ):
+    """Create an AwasuApi object for an instance (if necessary)."""
+    return AwasuApi( api ) if isinstance( api, str ) else api
+
+def route_to_first( names, api_name, args ): #pylint: disable=unused-argument
+    """Routing function that sends every call to the first instance."""
+    return names[0]
+
+def route_by_hash( names, api_name, args ): #pylint: disable=unused-argument
+    """Routing function that spreads calls across the instances, based on a hash of their arguments.
+
+    The same arguments (e.g. a feed URL) always go to the same instance.
+    """
+    return names[ zlib.crc32( str(args).encode( "utf-8" ) ) % len(names) ]
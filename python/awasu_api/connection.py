@@ -0,0 +1,166 @@
+""" Manages persistent HTTP connections to Awasu.
+"""
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import threading
+import collections
+import socket
+import time
+
+try:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+except ImportError:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+try:
+    from urlparse import urlsplit
+except ImportError:
+    from urllib.parse import urlsplit
+
+# ---------------------------------------------------------------------
+
+class ConnectionPool:
+    """Holds a pool of persistent HTTP/1.1 connections, per host.
+
+    Connections are handed out to one caller at a time, and returned to the pool
+    once the response has been fully read. Up to max_size idle connections are kept per host
+    (there is no limit on how many connections can be in use at once). The pool is thread-safe, so a single
+    instance can be shared by multiple threads (and multiple AwasuApi objects).
+    """
+
+    DEFAULT_MAX_SIZE = 8
+    DEFAULT_IDLE_TIMEOUT = 30
+
+    def __init__( self, max_size=None, idle_timeout=None, timeout=None ):
+        self.max_size = max_size if max_size is not None else ConnectionPool.DEFAULT_MAX_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else ConnectionPool.DEFAULT_IDLE_TIMEOUT
+        self.timeout = timeout
+        self._idle_conns = {} # nb: (scheme,host,port) => deque of (conn,time-released)
+        self._lock = threading.Lock()
+
+    def request( self, method, url, body=None, headers=None, metrics=None ): #pylint: disable=too-many-arguments
+        """Send an HTTP request, and return the connection and response.
+
+        The caller must read the response, then pass both objects to release()
+        (this is safe even if something went wrong, since the connection will only be
+        re-used if the response was read in full). If a CallMetrics object is given,
+        the connect and time-to-first-byte times are recorded in it.
+        """
+        key, path = split_url( url )
+        start_time = time.perf_counter()
+        retried = False
+        while True:
+            conn, is_reused = self._get_conn( key, metrics )
+            try:
+                conn.request( method, path, body, headers or {} )
+                resp = conn.getresponse()
+            except (ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # NOTE: If Awasu closed an idle connection, we only find out when we try to use it,
+                # so we retry (once) with another connection. We only do this if Awasu dropped
+                # the connection without sending a response (nb: RemoteDisconnected is a ConnectionResetError),
+                # since Awasu calls are POST's, and re-sending a request that Awasu may have acted on
+                # (e.g. after a timeout) could cause it to be actioned twice.
+                if is_reused and not retried:
+                    retried = True
+                    continue
+                raise
+            except (HTTPException, socket.error):
+                conn.close()
+                raise
+            if metrics is not None:
+                metrics.first_byte_time = time.perf_counter() - start_time
+            return conn, resp
+
+    def release( self, conn, resp ):
+        """Return a connection to the pool."""
+        if resp.will_close or not resp.isclosed():
+            # nb: the connection can't be re-used
+            conn.close()
+            return
+        key = conn.awasu_pool_key
+        with self._lock:
+            conns = self._idle_conns.setdefault( key, collections.deque() )
+            if len(conns) >= self.max_size:
+                conn.close()
+                return
+            conns.append( ( conn, time.time() ) )
+
+    def close( self ):
+        """Close all idle connections."""
+        with self._lock:
+            idle_conns, self._idle_conns = self._idle_conns, {}
+        for conns in idle_conns.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _get_conn( self, key, metrics=None ):
+        """Get a connection from the pool, or create a new one."""
+        now = time.time()
+        with self._lock:
+            conns = self._idle_conns.get( key )
+            # evict connections that have been idle for too long
+            # NOTE: Connections are returned to the end of the deque, so the oldest ones are at the front.
+            stale_conns = []
+            while conns and now - conns[0][1] > self.idle_timeout:
+                stale_conns.append( conns.popleft()[0] )
+            conn = conns.pop()[0] if conns else None
+        for stale_conn in stale_conns:
+            stale_conn.close()
+        if conn:
+            return conn, True
+        # create a new connection
+        scheme, host, port = key
+        conn_class = HTTPSConnection if scheme == "https" else HTTPConnection
+        if self.timeout is not None:
+            conn = conn_class( host, port, timeout=self.timeout )
+        else:
+            conn = conn_class( host, port )
+        conn.awasu_pool_key = key
+        start_time = time.perf_counter()
+        conn.connect()
+        if metrics is not None:
+            metrics.connect_time += time.perf_counter() - start_time
+        return conn, False
+
+    def __str__( self ):
+        with self._lock:
+            n_idle = sum( len(conns) for conns in self._idle_conns.values() )
+        return "ConnectionPool: max={} ; idle={}".format( self.max_size, n_idle )
+
+# ---------------------------------------------------------------------
+
+def split_url( url ):
+    """Split a URL into a (scheme,host,port) key and request path."""
+    parts = urlsplit( url )
+    scheme = parts.scheme or "http"
+    port = parts.port or ( 443 if scheme == "https" else 80 )
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return ( scheme, parts.hostname, port ), path
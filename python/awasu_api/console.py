@@ -30,24 +30,20 @@
 
 import sys
 import os
-from xml.etree import ElementTree
 import json
 import getopt
 
 try:
-    from urllib2 import HTTPError
+    from httplib import responses as http_status_names
 except ImportError:
-    from urllib.request import HTTPError
-try:
-    from BaseHTTPServer import BaseHTTPRequestHandler
-except ImportError:
-    from http.server import BaseHTTPRequestHandler
+    from http.client import responses as http_status_names
 
-from awasu_api.api import AwasuApi, convert_api_args
+from awasu_api.api import AwasuApi, convert_api_args, ElementTree, urllib_error
+from awasu_api.utils import iter_concurrently
 
 # ---------------------------------------------------------------------
 
-def main():
+def main(): #pylint: disable=too-many-locals,too-many-branches,too-many-statements
     """Main processing."""
 
     # parse the command-line arguments
@@ -55,11 +51,13 @@ def main():
     token = None
     dump_headers = False
     raw_mode = False
+    batch_fname = None
+    n_jobs = 1
     try:
         opts, args = getopt.getopt(
             sys.argv[1:],
-            "u:t:hr?",
-            [ "url=", "token=", "headers", "raw", "help" ]
+            "u:t:hrb:j:?",
+            [ "url=", "token=", "headers", "raw", "batch=", "jobs=", "help" ]
         )
     except getopt.GetoptError as err:
         raise Exception( "Can't parse arguments: {}".format( err ) ) from err
@@ -72,11 +70,26 @@ def main():
             dump_headers = True
         elif opt in ("-r", "--raw"):
             raw_mode = True
+        elif opt in ("-b", "--batch"):
+            batch_fname = val
+        elif opt in ("-j", "--jobs"):
+            n_jobs = int( val )
+            if n_jobs < 1:
+                raise Exception( "Invalid number of jobs: {}".format( n_jobs ) )
         elif opt in ("-?", "--help"):
             print_help()
             sys.exit()
         else:
             raise Exception( "Invalid command line option: {}".format( opt ) )
+    if batch_fname:
+        # run the API calls in the batch file
+        awasu_api = AwasuApi( url, token, pool_size=n_jobs )
+        if batch_fname == "-":
+            run_batch( awasu_api, sys.stdin, sys.stdout, n_jobs, raw_mode, dump_headers )
+        else:
+            with open( batch_fname, "r", encoding="utf-8" ) as fp:
+                run_batch( awasu_api, fp, sys.stdout, n_jobs, raw_mode, dump_headers )
+        return
     if len(args) == 0:
         print_help()
         sys.exit()
@@ -89,9 +102,9 @@ def main():
         hdrs, body = awasu_api.call_api(
             args[0], api_args, post_data, raw_mode, True
         )
-    except HTTPError as xcptn:
+    except urllib_error.HTTPError as xcptn:
         print( "HTTP {}: {}".format(
-            xcptn.code, BaseHTTPRequestHandler.responses[xcptn.code][0]
+            xcptn.code, http_status_names.get( xcptn.code, "" )
         ) )
         print( xcptn.read() )
         hdrs = {}
@@ -106,12 +119,60 @@ def main():
             for key,val in hdrs.items():
                 print( fmt.format( str(key)+":", val ) )
         print( "" )
-    if isinstance( body, ElementTree.Element ):
-        print( ElementTree.tostring( body ).decode( "utf-8" ) )
-    elif isinstance( body, dict ):
+    if isinstance( body, dict ):
         print( json.dumps( body ) )
-    elif body:
-        print( body.decode( "utf-8" ) )
+    elif isinstance( body, bytes ):
+        if body:
+            print( body.decode( "utf-8" ) )
+    elif body is not None:
+        print( ElementTree.tostring( body ).decode( "utf-8" ) )
+
+# ---------------------------------------------------------------------
+
+def run_batch( awasu_api, fp, out, n_jobs, raw_mode, dump_headers ): #pylint: disable=too-many-arguments
+    """Run a batch of API calls, read as JSON Lines, and write the results as JSON Lines.
+
+    Each line specifies a call e.g.
+        { "api": "channels/list", "args": { "verbose": 1 }, "post": "..." }
+    The args can also be given as a list of "key=val" strings, and "raw" overrides the raw mode.
+    The calls are run concurrently (over a shared pool of connections), but the results are written
+    in the same order as the calls were read.
+    """
+    def run_call( line ):
+        line_no, line = line
+        return _run_batch_call( awasu_api, line_no, line, raw_mode, dump_headers )
+    lines = ( ( line_no, line ) for line_no, line in enumerate( fp, start=1 ) if line.strip() )
+    for result in iter_concurrently( run_call, lines, n_jobs ):
+        out.write( json.dumps( result ) + "\n" )
+        out.flush()
+
+def _run_batch_call( awasu_api, line_no, line, raw_mode, dump_headers ):
+    """Run an API call from a batch file."""
+    result = { "line": line_no }
+    try:
+        call_spec = json.loads( line )
+        api_args = call_spec.get( "args" )
+        if isinstance( api_args, list ):
+            api_args = convert_api_args( api_args )
+        hdrs, body = awasu_api.call_api(
+            call_spec["api"], api_args, call_spec.get( "post" ), call_spec.get( "raw", raw_mode ), True
+        )
+    except urllib_error.HTTPError as xcptn:
+        result["status"] = xcptn.code
+        result["error"] = http_status_names.get( xcptn.code, "" )
+        result["body"] = xcptn.read().decode( "utf-8", "replace" )
+        return result
+    except Exception as xcptn: #pylint: disable=broad-except
+        result["error"] = "{}: {}".format( type(xcptn).__name__, xcptn )
+        return result
+    if dump_headers:
+        result["headers"] = hdrs
+    if isinstance( body, bytes ):
+        body = body.decode( "utf-8", "replace" )
+    elif body is not None and not isinstance( body, ( dict, list ) ):
+        body = ElementTree.tostring( body ).decode( "utf-8" )
+    result["result"] = body
+    return result
 
 # ---------------------------------------------------------------------
 
@@ -127,6 +188,8 @@ def print_help():
     print( "  -t --token     Awasu API token." )
     print( "  -h --headers   Output the HTTP response headers." )
     print( "  -r --raw       Output the raw response." )
+    print( "  -b --batch     Run the API calls in a file (\"-\" for stdin)." )
+    print( "  -j --jobs      Number of API calls to run at the same time (batch mode)." )
     print( "" )
     print( """The arguments following [api-name] are passed on to Awasu via the API call and are specified as they would normally be in a URL (i.e. "key=val" pairs).
 
@@ -144,6 +207,11 @@ Examples:
 
   Add an item to the default workpad:
     {script_name} workpads/addItem id=@ url=https://awasu.com title=Awasu
+
+In batch mode, each line of the batch file is a JSON object that specifies an API call, and the results are output as JSON objects, one per line (in the same order):
+    {{ "api": "channels/list", "args": {{ "verbose": 1 }} }}
+    {{ "api": "workpads/addItem", "args": [ "id=@", "url=https://awasu.com" ] }}
+    {{ "api": "reports/update", "args": {{ "id": 123 }}, "post": "<channelReport>...</channelReport>" }}
 """.format( script_name=script_name ) )
     #pylint: enable=line-too-long
 
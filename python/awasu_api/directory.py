@@ -0,0 +1,181 @@
+""" Provides fast lookups of Awasu channels.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+from awasu_api.local_copy import LocalCopy
+from awasu_api.utils import normalize_id
+
+# ---------------------------------------------------------------------
+
+class ChannelDirectory( LocalCopy ): #pylint: disable=too-many-instance-attributes
+    """Keeps a local copy of the channel list, indexed by ID, name, feed URL and folder.
+
+    The channel list is downloaded once, and then kept up-to-date incrementally: channels created
+    or deleted through the AwasuApi object are added/removed as they happen (new channels are only
+    fetched when the directory is next used). Since Awasu can also be changed by other programs,
+    the full list is also re-downloaded when it is older than the TTL.
+
+    Channels only have a folder in verbose listings, so if the folder index is used (e.g. find_by_folder()),
+    the channel list is re-downloaded in verbose mode (if it wasn't already).
+    """
+
+    DEFAULT_TTL = 300
+
+    def __init__( self, api, ttl=None, verbose=False ):
+        self.verbose = verbose
+        self._by_name = {}
+        self._by_url = {}
+        self._by_folder = {}
+        self._created_ids = set()
+        self._want_folders = False
+        super().__init__( api, ttl if ttl is not None else ChannelDirectory.DEFAULT_TTL )
+
+    def refresh( self ):
+        """Re-download the full channel list."""
+        channels = self.api.get_channels( verbose=self._is_verbose() )
+        with self._lock:
+            self._by_id, self._by_name, self._by_url, self._by_folder = {}, {}, {}, {}
+            self._created_ids.clear()
+            for channel in channels:
+                self._add( channel )
+            self._reset_expiry_time()
+
+    def get( self, channel_id ):
+        """Get a channel by ID (or None)."""
+        with self._lock:
+            self._update()
+            return self._by_id.get( normalize_id( channel_id ) )
+
+    def find_by_name( self, name ):
+        """Get the channels with the specified name."""
+        return self._find( "_by_name", name )
+
+    def find_by_url( self, url ):
+        """Get the channels with the specified feed URL."""
+        return self._find( "_by_url", url )
+
+    def find_by_folder( self, folder ):
+        """Get the channels in the specified folder."""
+        return self._find( "_by_folder", folder )
+
+    def get_folders( self ):
+        """Get the folders that contain channels."""
+        with self._lock:
+            self._want_folder_index()
+            self._update()
+            return list( self._by_folder.keys() )
+
+    def _find( self, index_name, val ):
+        """Look up an index."""
+        with self._lock:
+            if index_name == "_by_folder":
+                self._want_folder_index()
+            self._update()
+            # NOTE: We get the index only after updating, since refresh() replaces it.
+            return list( getattr( self, index_name ).get( val, {} ).values() )
+
+    def _want_folder_index( self ):
+        """Make sure we have each channel's folder."""
+        if self._is_verbose():
+            return
+        self._want_folders = True
+        self._expiry_time = None # nb: force the channel list to be re-downloaded in verbose mode
+
+    def _is_verbose( self ):
+        """Check if the channel list should be downloaded in verbose mode."""
+        return self.verbose or self._want_folders
+
+    def _update( self ):
+        """Make sure the directory is up-to-date."""
+        if self._is_stale():
+            self.refresh()
+            return
+        if self._created_ids:
+            # fetch the channels that have been created since we last looked
+            # NOTE: If someone else deleted one of them in the meantime, the whole call will fail,
+            # so we fall back to re-downloading everything.
+            created_ids, self._created_ids = sorted( self._created_ids ), set()
+            try:
+                channels = self.api.get_channels( created_ids, verbose=self._is_verbose() )
+            except Exception: #pylint: disable=broad-except
+                self.refresh()
+                return
+            for channel in channels:
+                self._add( channel )
+
+    def _on_change( self, api_name, ids, api_args ): #pylint: disable=unused-argument
+        """Called when a change is made through the AwasuApi object."""
+        with self._lock:
+            if self._expiry_time is None:
+                return # nb: we haven't loaded anything yet
+            if api_name == "channels/create":
+                self._created_ids.update( ids )
+            elif api_name == "channels/delete":
+                for channel_id in ids:
+                    self._created_ids.discard( channel_id )
+                    self._remove( channel_id )
+            elif api_name == "channels/folders/delete":
+                # nb: the channels in the folder will have been moved or deleted
+                self._expiry_time = None
+
+    def _add( self, channel ):
+        """Add a channel to the indexes."""
+        channel_id = normalize_id( channel["id"] )
+        self._remove( channel_id )
+        self._by_id[ channel_id ] = channel
+        # NOTE: Names and URL's aren't necessarily unique, so these indexes map to a dict of channels
+        # (keyed by ID, so that removing a channel is also O(1)).
+        for index, key in ( (self._by_name,"name"), (self._by_url,"feedUrl"), (self._by_folder,"folder") ):
+            val = channel.get( key )
+            if val is not None:
+                index.setdefault( val, {} )[ channel_id ] = channel
+
+    def _remove( self, channel_id ):
+        """Remove a channel from the indexes."""
+        channel = self._by_id.pop( normalize_id( channel_id ), None )
+        if channel is None:
+            return
+        for index, key in ( (self._by_name,"name"), (self._by_url,"feedUrl"), (self._by_folder,"folder") ):
+            channels = index.get( channel.get( key ) )
+            if channels is not None:
+                channels.pop( normalize_id( channel_id ), None )
+                if not channels:
+                    del index[ channel.get( key ) ]
+
+    def __contains__( self, channel_id ):
+        return self.get( channel_id ) is not None
+
+    def __iter__( self ):
+        with self._lock:
+            self._update()
+            return iter( list( self._by_id.values() ) )
+
+    def __str__( self ):
+        return "ChannelDirectory: channels={}".format( len(self._by_id) )
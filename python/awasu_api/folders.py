@@ -0,0 +1,201 @@
+""" Provides fast lookups of Awasu channel folders.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+from awasu_api.local_copy import LocalCopy
+from awasu_api.utils import normalize_id
+
+# ---------------------------------------------------------------------
+
+class ChannelFolder:
+    """A channel folder in a ChannelFolderTree."""
+
+    __slots__ = ( "id", "name", "parent", "children", "path" )
+
+    def __init__( self, folder_id, name, parent, path ):
+        self.id = folder_id #pylint: disable=invalid-name
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.path = path
+
+    def __repr__( self ):
+        return "ChannelFolder({!r}, {!r})".format( self.id, self.path )
+
+# ---------------------------------------------------------------------
+
+class ChannelFolderTree( LocalCopy ):
+    """Keeps a local copy of the channel folder tree, indexed by ID and path.
+
+    Each folder has a pointer to its parent, and its full path (e.g. "News/Tech/AI") is precomputed,
+    so looking up a folder, or its ancestors, doesn't need a walk of the tree. Folders created or deleted
+    through the AwasuApi object are added/removed in place. Since Awasu can also be changed by other programs,
+    the full tree is also re-downloaded when it is older than the TTL.
+    """
+
+    DEFAULT_TTL = 300
+    PATH_SEPARATOR = "/"
+
+    # NOTE: These are the keys that might hold a folder's sub-folders.
+    CHILDREN_KEYS = ( "channelFolders", "childFolders", "folders" )
+
+    def __init__( self, api, ttl=None ):
+        self._root = None
+        self._by_path = {}
+        super().__init__( api, ttl if ttl is not None else ChannelFolderTree.DEFAULT_TTL )
+
+    def refresh( self ):
+        """Re-download the folder tree."""
+        tree = self.api.get_channel_folders( tree=True )
+        with self._lock:
+            self._by_id, self._by_path = {}, {}
+            if isinstance( tree, list ):
+                # nb: we got a list of top-level folders, so we create a dummy root folder for them
+                self._root = self._add( None, None, None )
+                for folder in tree:
+                    self._load( folder, self._root )
+            else:
+                self._root = self._load( tree, None )
+            self._reset_expiry_time()
+
+    @property
+    def root( self ):
+        """The root folder."""
+        with self._lock:
+            self._update()
+            return self._root
+
+    def get( self, folder_id ):
+        """Get a folder by ID (or None)."""
+        with self._lock:
+            self._update()
+            return self._by_id.get( normalize_id( folder_id ) )
+
+    def find_by_path( self, path ):
+        """Get a folder by its path (or None)."""
+        path = ChannelFolderTree.PATH_SEPARATOR.join( p for p in path.split( ChannelFolderTree.PATH_SEPARATOR ) if p )
+        with self._lock:
+            self._update()
+            return self._by_path.get( path )
+
+    def get_ancestors( self, folder_id ):
+        """Get a folder's ancestors (starting with its parent, and ending with the root)."""
+        folder = self.get( folder_id )
+        ancestors = []
+        while folder is not None and folder.parent is not None:
+            folder = folder.parent
+            ancestors.append( folder )
+        return ancestors
+
+    def iter_subtree( self, folder_id=None ):
+        """Iterate over a folder, and all the folders under it (depth-first)."""
+        with self._lock:
+            self._update()
+            folder = self._root if folder_id is None else self._by_id.get( normalize_id( folder_id ) )
+            if folder is None:
+                return iter( [] )
+            # NOTE: We take a snapshot, in case the tree changes while the caller is iterating.
+            folders = []
+            stack = [ folder ]
+            while stack:
+                folder = stack.pop()
+                folders.append( folder )
+                stack.extend( reversed( folder.children ) )
+            return iter( folders )
+
+    def _load( self, folder, parent ):
+        """Load a folder (and its sub-folders) from the JSON response."""
+        node = self._add( folder.get( "id" ), folder.get( "name" ), parent )
+        for key in ChannelFolderTree.CHILDREN_KEYS:
+            if key in folder:
+                for child in folder[key] or []:
+                    self._load( child, node )
+                break
+        return node
+
+    def _add( self, folder_id, name, parent, insert_after=None ):
+        """Add a folder to the tree."""
+        if parent is None:
+            path = "" # nb: paths are relative to the root folder
+        else:
+            path = ChannelFolderTree.PATH_SEPARATOR.join( p for p in ( parent.path, name ) if p )
+        node = ChannelFolder( normalize_id( folder_id ), name, parent, path )
+        if parent is not None:
+            pos = len( parent.children )
+            if insert_after is not None:
+                for i, child in enumerate( parent.children ):
+                    if child.id == normalize_id( insert_after ):
+                        pos = i + 1
+                        break
+            parent.children.insert( pos, node )
+        if node.id is not None:
+            self._by_id[ node.id ] = node
+        self._by_path[ path ] = node
+        return node
+
+    def _remove( self, folder ):
+        """Remove a folder (and its sub-folders) from the tree."""
+        if folder.parent is not None:
+            folder.parent.children.remove( folder )
+        stack = [ folder ]
+        while stack:
+            folder = stack.pop()
+            self._by_id.pop( folder.id, None )
+            if self._by_path.get( folder.path ) is folder:
+                del self._by_path[ folder.path ]
+            stack.extend( folder.children )
+
+    def _on_change( self, api_name, ids, api_args ):
+        """Called when a change is made through the AwasuApi object."""
+        with self._lock:
+            if self._expiry_time is None:
+                return # nb: we haven't loaded anything yet
+            if api_name == "channels/folders/create":
+                parent = self._find_parent( api_args.get( "parent" ) )
+                if parent is None:
+                    # nb: we don't know where the new folder went, so we re-download the tree next time
+                    self._expiry_time = None
+                    return
+                self._add( ids[0], api_args.get( "name" ), parent, api_args.get( "after" ) )
+            elif api_name == "channels/folders/delete":
+                for folder_id in ids:
+                    folder = self._by_id.get( normalize_id( folder_id ) )
+                    if folder is not None:
+                        self._remove( folder )
+
+    def _find_parent( self, parent ):
+        """Find the parent folder specified when creating a new folder."""
+        if not parent:
+            return self._root
+        # NOTE: The parent may have been specified as an ID or a path.
+        return self._by_id.get( normalize_id( parent ) ) or self._by_path.get( str( parent ) )
+
+    def __str__( self ):
+        return "ChannelFolderTree: folders={}".format( len(self._by_id) )
@@ -0,0 +1,118 @@
+""" Limits the number of concurrent requests sent to Awasu.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import threading
+import time
+
+# ---------------------------------------------------------------------
+
+class AdaptiveLimiter: #pylint: disable=too-many-instance-attributes
+    """Limits the number of requests in flight to Awasu, adjusting the limit as conditions change.
+
+    The limit is managed AIMD-style: it is raised slowly while requests are completing normally,
+    and cut back sharply if a request fails, or its latency climbs well above the best recent latency
+    for that endpoint (a sign that requests are queuing up inside Awasu). Requests that would exceed
+    the limit wait until a slot becomes free. A limiter can be shared between multiple AwasuApi objects.
+    """
+
+    DEFAULT_INITIAL_LIMIT = 4
+    DEFAULT_MIN_LIMIT = 1
+    DEFAULT_MAX_LIMIT = 64
+    DEFAULT_BACKOFF = 0.5
+    DEFAULT_LATENCY_TOLERANCE = 2.0
+
+    # NOTE: The baseline latency is allowed to drift upwards slowly, so that if Awasu just gets slower
+    # (e.g. because its database has grown), we adjust to it, instead of backing off forever.
+    BASELINE_DRIFT = 0.01
+
+    def __init__( self, initial_limit=None, min_limit=None, max_limit=None, backoff=None, latency_tolerance=None ): #pylint: disable=too-many-arguments,line-too-long
+        self.min_limit = min_limit if min_limit is not None else AdaptiveLimiter.DEFAULT_MIN_LIMIT
+        self.max_limit = max_limit if max_limit is not None else AdaptiveLimiter.DEFAULT_MAX_LIMIT
+        self.backoff = backoff if backoff is not None else AdaptiveLimiter.DEFAULT_BACKOFF
+        self.latency_tolerance = latency_tolerance if latency_tolerance is not None \
+            else AdaptiveLimiter.DEFAULT_LATENCY_TOLERANCE
+        limit = initial_limit if initial_limit is not None else AdaptiveLimiter.DEFAULT_INITIAL_LIMIT
+        self._limit = float( min( max( limit, self.min_limit ), self.max_limit ) )
+        self._in_flight = 0
+        self._baselines = {} # nb: endpoint => best recent latency (in seconds)
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit( self ):
+        """The current number of requests allowed in flight."""
+        return int( self._limit )
+
+    @property
+    def in_flight( self ):
+        """The number of requests currently in flight."""
+        return self._in_flight
+
+    def acquire( self ):
+        """Wait for a free slot, and return the time the request started.
+
+        The caller must pass the returned value to release() once the request has completed.
+        """
+        with self._cond:
+            while self._in_flight >= int( self._limit ):
+                self._cond.wait()
+            self._in_flight += 1
+        return time.perf_counter()
+
+    def release( self, start_time, failed=False, key=None ):
+        """Release a slot, and adjust the limit based on how the request went.
+
+        The key identifies the endpoint that was called, since some endpoints are much slower than others.
+        """
+        now = time.perf_counter()
+        latency = now - start_time
+        with self._cond:
+            was_saturated = self._in_flight >= int( self._limit )
+            self._in_flight -= 1
+            baseline = self._baselines.get( key )
+            if not failed:
+                self._baselines[ key ] = latency if baseline is None \
+                    else min( latency, baseline * (1+AdaptiveLimiter.BASELINE_DRIFT) )
+            if failed or ( baseline is not None and latency > self.latency_tolerance * baseline ):
+                # NOTE: Requests that were already in flight when we last backed off will probably
+                # also report problems, but they were sent under the old limit, so we ignore them
+                # (otherwise, the limit would collapse).
+                if start_time >= self._last_decrease:
+                    self._limit = max( self.min_limit, self._limit * self.backoff )
+                    self._last_decrease = now
+            elif was_saturated:
+                # nb: we only raise the limit if we're actually using it (this adds ~1 per round-trip)
+                self._limit = min( self.max_limit, self._limit + 1.0/self._limit )
+            self._cond.notify_all()
+
+    def __str__( self ):
+        with self._cond:
+            return "AdaptiveLimiter: limit={} ; in-flight={}".format( int( self._limit ), self._in_flight )
@@ -0,0 +1,86 @@
+""" Base class for objects that keep a local copy of something in Awasu.
+"""
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import abc
+import threading
+import time
+
+# ---------------------------------------------------------------------
+
+class LocalCopy( abc.ABC ):
+    """Base class for objects that keep a local copy of something in Awasu, indexed by ID.
+
+    Changes made through the AwasuApi object are passed to _on_change(), so that the local copy
+    can be updated in place, and the whole thing is re-downloaded (by refresh()) when it is older than the TTL.
+    """
+
+    def __init__( self, api, ttl ):
+        self.api = api
+        self.ttl = ttl
+        self._by_id = {}
+        self._expiry_time = None
+        self._lock = threading.RLock()
+        api.add_change_listener( self._on_change )
+
+    @abc.abstractmethod
+    def refresh( self ):
+        """Re-download everything."""
+
+    def close( self ):
+        """Stop tracking changes made through the AwasuApi object."""
+        self.api.remove_change_listener( self._on_change )
+
+    def _is_stale( self ):
+        """Check if the local copy needs to be re-downloaded."""
+        return self._expiry_time is None or time.time() >= self._expiry_time
+
+    def _reset_expiry_time( self ):
+        """Start the TTL (after the local copy has been re-downloaded)."""
+        self._expiry_time = time.time() + self.ttl
+
+    def _update( self ):
+        """Make sure the local copy is up-to-date."""
+        if self._is_stale():
+            self.refresh()
+
+    @abc.abstractmethod
+    def _on_change( self, api_name, ids, api_args ):
+        """Called when a change is made through the AwasuApi object."""
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        self.close()
+
+    def __len__( self ):
+        with self._lock:
+            self._update()
+            return len( self._by_id )
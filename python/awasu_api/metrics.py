@@ -0,0 +1,154 @@
+""" Collects performance metrics for calls to the Awasu API.
+"""
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import sys
+import threading
+import bisect
+
+# ---------------------------------------------------------------------
+
+class CallMetrics: #pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """Holds the metrics for a single call to the Awasu API.
+
+    Times are in seconds, and byte counts are for the response body (as received, and after decompression).
+    """
+
+    def __init__( self, api_name ):
+        self.api_name = api_name
+        self.error = None
+        self.cached = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bytes_decompressed = 0
+        self.connect_time = 0.0
+        self.first_byte_time = 0.0
+        self.read_time = 0.0
+        self.inflate_time = 0.0
+        self.parse_time = 0.0
+        self.check_time = 0.0
+        self.total_time = 0.0
+
+    def __str__( self ):
+        return "CallMetrics: {} ; total={:.1f}ms ; connect={:.1f}ms ; first-byte={:.1f}ms ; read={:.1f}ms" \
+               " ; inflate={:.1f}ms ; parse={:.1f}ms ; check={:.1f}ms ; received={} ; decompressed={}".format(
+            self.api_name, 1000*self.total_time, 1000*self.connect_time, 1000*self.first_byte_time,
+            1000*self.read_time, 1000*self.inflate_time, 1000*self.parse_time, 1000*self.check_time,
+            self.bytes_received, self.bytes_decompressed
+        )
+
+# ---------------------------------------------------------------------
+
+class MetricsAggregator:
+    """Aggregates per-call metrics by endpoint.
+
+    Register an instance as a call listener, then call snapshot() or dump() periodically e.g.
+        metrics = MetricsAggregator()
+        api.add_call_listener( metrics )
+    """
+
+    # NOTE: These are the upper bounds (in seconds) for the latency histogram buckets.
+    # There is an extra bucket at the end for anything slower.
+    DEFAULT_BUCKETS = ( 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10 )
+
+    _TIMINGS = ( "connect_time", "first_byte_time", "read_time", "inflate_time", "parse_time", "check_time" )
+
+    def __init__( self, buckets=None ):
+        self.buckets = tuple( buckets ) if buckets else MetricsAggregator.DEFAULT_BUCKETS
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__( self, metrics ):
+        """Record the metrics for a call."""
+        with self._lock:
+            stats = self._endpoints.get( metrics.api_name )
+            if stats is None:
+                stats = self._endpoints[ metrics.api_name ] = {
+                    "count": 0, "errors": 0, "cached": 0,
+                    "bytes_received": 0, "bytes_decompressed": 0,
+                    "total_time": 0.0, "max_time": 0.0,
+                    "histogram": [ 0 ] * ( len(self.buckets) + 1 ),
+                }
+                for key in MetricsAggregator._TIMINGS:
+                    stats[ key ] = 0.0
+            stats["count"] += 1
+            if metrics.error is not None:
+                stats["errors"] += 1
+            if metrics.cached:
+                stats["cached"] += 1
+            stats["bytes_received"] += metrics.bytes_received
+            stats["bytes_decompressed"] += metrics.bytes_decompressed
+            stats["total_time"] += metrics.total_time
+            stats["max_time"] = max( stats["max_time"], metrics.total_time )
+            for key in MetricsAggregator._TIMINGS:
+                stats[ key ] += getattr( metrics, key )
+            stats["histogram"][ bisect.bisect_left( self.buckets, metrics.total_time ) ] += 1
+
+    def snapshot( self, reset=False ):
+        """Return the aggregated metrics, as a dictionary keyed by endpoint."""
+        with self._lock:
+            snapshot = {
+                api_name: dict( stats, histogram=list( stats["histogram"] ) )
+                for api_name, stats in self._endpoints.items()
+            }
+            if reset:
+                self._endpoints = {}
+        return snapshot
+
+    def reset( self ):
+        """Reset the aggregated metrics."""
+        with self._lock:
+            self._endpoints = {}
+
+    def dump( self, out=None ):
+        """Dump the aggregated metrics."""
+        if out is None:
+            out = sys.stdout
+        snapshot = self.snapshot()
+        fmt = "{:<28} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}\n"
+        out.write( fmt.format(
+            "", "calls", "errors", "avg (ms)", "max (ms)", "connect", "1st byte", "read", "inflate", "parse"
+        ) )
+        for api_name in sorted( snapshot ):
+            stats = snapshot[ api_name ]
+            def avg_ms( key, stats=stats ):
+                return "{:.2f}".format( 1000 * stats[key] / stats["count"] )
+            out.write( fmt.format(
+                api_name, stats["count"], stats["errors"], avg_ms("total_time"),
+                "{:.2f}".format( 1000 * stats["max_time"] ),
+                avg_ms("connect_time"), avg_ms("first_byte_time"), avg_ms("read_time"),
+                avg_ms("inflate_time"), avg_ms("parse_time")
+            ) )
+            out.write( "  latency: {}\n".format( " ".join(
+                "<{:g}ms:{}".format( 1000*bound, count ) for bound, count in zip( self.buckets, stats["histogram"] )
+            ) + " >:{}".format( stats["histogram"][-1] ) ) )
+
+    def __str__( self ):
+        with self._lock:
+            return "MetricsAggregator: endpoints={}".format( len(self._endpoints) )
@@ -0,0 +1,161 @@
+""" Compact records for holding large listings returned by the Awasu API.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import sys
+import re
+import keyword
+import threading
+
+# ---------------------------------------------------------------------
+
+# NOTE: Strings longer than this are usually unique (e.g. descriptions), so there's no point interning them.
+INTERN_MAX_LENGTH = 64
+
+_record_classes = {} # nb: (class name,JSON keys) => record class
+_record_classes_lock = threading.Lock()
+
+# ---------------------------------------------------------------------
+
+class Record:
+    """Base class for compact records.
+
+    Records use __slots__, so they don't carry a per-object dictionary. Fields are accessed as attributes,
+    but records also support read-only dictionary-style access using the original JSON keys, so they can
+    be used in place of the dictionaries normally returned by the API.
+    """
+
+    __slots__ = ()
+    _keys = () # nb: the original JSON keys (in the same order as __slots__)
+
+    def __getitem__( self, key ):
+        try:
+            return getattr( self, self.__slots__[ self._keys.index( key ) ] )
+        except ValueError:
+            raise KeyError( key ) from None
+
+    def __contains__( self, key ):
+        return key in self._keys
+
+    def get( self, key, default=None ):
+        """Get a field, using its original JSON key."""
+        try:
+            return self[ key ]
+        except KeyError:
+            return default
+
+    def keys( self ):
+        """Return the original JSON keys."""
+        return list( self._keys )
+
+    def to_dict( self ):
+        """Convert the record (and any nested records) back to a dictionary."""
+        return {
+            key: _to_dict( getattr( self, attr ) ) for key, attr in zip( self._keys, self.__slots__ )
+        }
+
+    def __eq__( self, other ):
+        if not isinstance( other, Record ):
+            return NotImplemented
+        return self._keys == other._keys and all(
+            getattr( self, attr ) == getattr( other, attr ) for attr in self.__slots__
+        )
+
+    __hash__ = None
+
+    def __repr__( self ):
+        return "{}({})".format( type(self).__name__, ", ".join(
+            "{}={!r}".format( attr, getattr( self, attr ) ) for attr in self.__slots__
+        ) )
+
+def _to_dict( val ):
+    """Convert a value back to plain JSON."""
+    if isinstance( val, Record ):
+        return val.to_dict()
+    if isinstance( val, list ):
+        return [ _to_dict( v ) for v in val ]
+    return val
+
+# ---------------------------------------------------------------------
+
+def make_records( items, class_name="Record" ):
+    """Convert a list of JSON dictionaries into compact records."""
+    return [ make_record( item, class_name ) for item in items ]
+
+def make_record( item, class_name="Record" ):
+    """Convert a JSON value into a compact record.
+
+    Dictionaries are converted to records (a record class is created for each distinct set of keys),
+    and short strings are interned, so that repeated values (e.g. folder names and status values)
+    are only stored once.
+    """
+    if isinstance( item, dict ):
+        keys = tuple( item.keys() )
+        record_class = get_record_class( class_name, keys )
+        record = record_class.__new__( record_class )
+        for key, attr in zip( keys, record_class.__slots__ ):
+            setattr( record, attr, make_record( item[key], class_name ) )
+        return record
+    if isinstance( item, list ):
+        return [ make_record( v, class_name ) for v in item ]
+    if isinstance( item, str ) and len(item) <= INTERN_MAX_LENGTH:
+        return sys.intern( item )
+    return item
+
+def get_record_class( class_name, keys ):
+    """Get the record class for a set of JSON keys (creating it, if necessary)."""
+    cache_key = ( class_name, keys )
+    record_class = _record_classes.get( cache_key )
+    if record_class:
+        return record_class
+    with _record_classes_lock:
+        record_class = _record_classes.get( cache_key )
+        if not record_class:
+            attrs = []
+            for key in keys:
+                attr = _make_attr_name( key )
+                while attr in attrs:
+                    attr += "_"
+                attrs.append( attr )
+            record_class = type( class_name, (Record,), {
+                "__slots__": tuple( attrs ),
+                "_keys": keys,
+            } )
+            _record_classes[ cache_key ] = record_class
+    return record_class
+
+def _make_attr_name( key ):
+    """Convert a JSON key into a valid attribute name."""
+    attr = re.sub( r"\W", "_", key )
+    if not attr or attr[0].isdigit():
+        attr = "_" + attr
+    if keyword.iskeyword( attr ) or attr in ( "get", "keys", "to_dict", "_keys" ):
+        attr += "_"
+    return attr
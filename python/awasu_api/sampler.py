@@ -0,0 +1,233 @@
+""" Periodically samples the Awasu stats.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import threading
+import time
+import math
+from array import array
+
+# ---------------------------------------------------------------------
+
+class StatsSampler: #pylint: disable=too-many-instance-attributes
+    """Periodically samples the Awasu stats, and keeps a compact history of them.
+
+    Only numeric fields are kept (nested fields are flattened into dotted names), each in its own
+    fixed-size ring buffer of doubles, per metric (and per channel, for the channel stats), so memory usage
+    stays bounded no matter how long the sampler runs. The raw responses are not retained.
+
+    Sampling can be done manually (by calling sample()), or in a background thread (start()/stop(),
+    or use the object as a context manager).
+    """
+
+    DEFAULT_INTERVAL = 10
+    DEFAULT_HISTORY = 120
+
+    def __init__( self, api, interval=None, history=None, channel_ids=None ):
+        self.api = api
+        self.interval = interval if interval is not None else StatsSampler.DEFAULT_INTERVAL
+        self.history = history if history is not None else StatsSampler.DEFAULT_HISTORY
+        # nb: None = sample every channel, [] = don't sample the channel stats
+        self.channel_ids = channel_ids
+        self.last_error = None
+        self._times = array( "d", [math.nan] ) * self.history
+        self._n_samples = 0
+        self._series = {} # nb: (channel ID,metric) => array of values (the channel ID is None for the Awasu stats)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def sample( self ):
+        """Take a sample of the current stats."""
+        stats = self.api.get_awasu_stats()
+        channel_stats = self.api.get_channel_stats( self.channel_ids ) if self.channel_ids != [] else []
+        now = time.time()
+        with self._lock:
+            pos = self._n_samples % self.history
+            self._times[ pos ] = now
+            # NOTE: We're about to overwrite the oldest sample, so we clear it first, in case some
+            # metrics are missing from this sample.
+            for values in self._series.values():
+                values[ pos ] = math.nan
+            for metric, val in flatten_stats( stats ):
+                self._store( None, metric, pos, val )
+            for channel in channel_stats:
+                channel_id = channel.get( "id" )
+                for metric, val in flatten_stats( channel ):
+                    if metric != "id":
+                        self._store( channel_id, metric, pos, val )
+            self._n_samples += 1
+            if pos == self.history - 1:
+                # discard series that haven't had a value for a full cycle (e.g. for deleted channels)
+                for key in [ key for key, values in self._series.items() if all( math.isnan(v) for v in values ) ]:
+                    del self._series[ key ]
+
+    def _store( self, channel_id, metric, pos, val ):
+        """Store a value in a series."""
+        key = ( channel_id, metric )
+        values = self._series.get( key )
+        if values is None:
+            values = self._series[ key ] = array( "d", [math.nan] ) * self.history
+        values[ pos ] = val
+
+    def get_metrics( self, channel_id=None ):
+        """Get the names of the metrics that have been sampled (for the Awasu stats, or a channel)."""
+        with self._lock:
+            return sorted( key[1] for key in self._series if key[0] == channel_id )
+
+    def get_channel_ids( self ):
+        """Get the ID's of the channels that have been sampled."""
+        with self._lock:
+            return sorted( set( key[0] for key in self._series if key[0] is not None ) )
+
+    def get_samples( self, metric, channel_id=None ):
+        """Get the sampled values for a metric, as a list of (time,value), oldest first."""
+        with self._lock:
+            values = self._series.get( ( channel_id, metric ) )
+            if values is None:
+                return []
+            samples = []
+            for i in range( max( self._n_samples - self.history, 0 ), self._n_samples ):
+                pos = i % self.history
+                if not math.isnan( values[pos] ):
+                    samples.append( ( self._times[pos], values[pos] ) )
+            return samples
+
+    def get_latest( self, metric, channel_id=None ):
+        """Get the most recently sampled value for a metric (or None)."""
+        with self._lock:
+            values = self._series.get( ( channel_id, metric ) )
+            if values is None or self._n_samples == 0:
+                return None
+            val = values[ (self._n_samples-1) % self.history ]
+            return None if math.isnan( val ) else val
+
+    def get_delta( self, metric, channel_id=None, n_samples=1 ):
+        """Get how much a metric has changed over the last N samples (or None)."""
+        with self._lock:
+            delta = self._get_delta( self._series.get( ( channel_id, metric ) ), n_samples )
+        return delta[0] if delta else None
+
+    def get_rate( self, metric, channel_id=None, n_samples=1 ):
+        """Get how fast a metric has changed (per second) over the last N samples (or None)."""
+        with self._lock:
+            delta = self._get_delta( self._series.get( ( channel_id, metric ) ), n_samples )
+        return delta[0] / delta[1] if delta and delta[1] > 0 else None
+
+    def get_channel_rates( self, metric, n_samples=1 ):
+        """Get how fast a metric has changed (per second) for every channel, over the last N samples."""
+        rates = {}
+        with self._lock:
+            for key, values in self._series.items():
+                if key[0] is None or key[1] != metric:
+                    continue
+                delta = self._get_delta( values, n_samples )
+                if delta and delta[1] > 0:
+                    rates[ key[0] ] = delta[0] / delta[1]
+        return rates
+
+    def _get_delta( self, values, n_samples ):
+        """Get how much a series has changed over the last N samples, as (change in value,elapsed time)."""
+        if values is None or n_samples < 1 or n_samples >= min( self._n_samples, self.history ):
+            return None
+        pos1 = ( self._n_samples - 1 ) % self.history
+        pos0 = ( self._n_samples - 1 - n_samples ) % self.history
+        if math.isnan( values[pos0] ) or math.isnan( values[pos1] ):
+            return None
+        return values[pos1] - values[pos0], self._times[pos1] - self._times[pos0]
+
+    def start( self ):
+        """Start sampling in a background thread."""
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread( target=self._run, name="StatsSampler", daemon=True )
+        self._thread.start()
+
+    def stop( self ):
+        """Stop sampling in the background."""
+        if not self._thread:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run( self ):
+        """Take samples until we're told to stop."""
+        while True:
+            start_time = time.time()
+            try:
+                self.sample()
+                self.last_error = None
+            except Exception as xcptn: #pylint: disable=broad-except
+                # NOTE: We keep going, since Awasu may only be temporarily unavailable.
+                self.last_error = xcptn
+            elapsed = time.time() - start_time
+            if self._stop_event.wait( max( self.interval - elapsed, 0 ) ):
+                break
+
+    def __enter__( self ):
+        self.start()
+        return self
+
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        self.stop()
+
+    def __len__( self ):
+        return min( self._n_samples, self.history )
+
+    def __str__( self ):
+        with self._lock:
+            return "StatsSampler: samples={} ; series={}".format(
+                min( self._n_samples, self.history ), len(self._series)
+            )
+
+# ---------------------------------------------------------------------
+
+def flatten_stats( stats, prefix="" ):
+    """Extract the numeric fields from a stats dictionary, as (name,value) pairs.
+
+    Nested dictionaries are flattened into dotted names.
+    """
+    for key, val in stats.items():
+        name = prefix + key
+        if isinstance( val, dict ):
+            yield from flatten_stats( val, name+"." )
+            continue
+        if isinstance( val, bool ) or val is None:
+            continue
+        if isinstance( val, str ):
+            # NOTE: Numbers sometimes come back as strings.
+            try:
+                val = float( val )
+            except ValueError:
+                continue
+        if isinstance( val, ( int, float ) ):
+            yield name, float( val )
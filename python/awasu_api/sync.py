@@ -0,0 +1,293 @@
+""" Synchronizes Awasu's configuration with a description of how it should be.
+"""
+
+
+# COPYRIGHT:    (c) Awasu Pty. Ltd. 2015 (all rights reserved).
+#               Unauthorized use of this code is prohibited.
+#
+# LICENSE:      This software is provided 'as-is', without any express
+#               or implied warranty.
+#
+#               In no event will the author be held liable for any damages
+#               arising from the use of this software.
+#
+#               Permission is granted to anyone to use this software
+#               for any purpose and to alter it and redistribute it freely,
+#               subject to the following restrictions:
+#
+#               - The origin of this software must not be misrepresented;
+#                 you must not claim that you wrote the original software.
+#                 If you use this software, an acknowledgement is requested
+#                 but not required.
+#
+#               - Altered source versions must be plainly marked as such,
+#                 and must not be misrepresented as being the original software.
+#                 Altered source is encouraged to be submitted back to
+#                 the original author so it can be shared with the community.
+#                 Please share your changes.
+#
+#               - This notice may not be removed or altered from any
+#                 source distribution.
+
+import sys
+
+from awasu_api.api import AwasuApi, AwasuApiException
+from awasu_api.folders import ChannelFolderTree
+from awasu_api.utils import run_concurrently, normalize_id
+
+# ---------------------------------------------------------------------
+
+class SyncOp:
+    """A single change to be made to Awasu's configuration."""
+
+    def __init__( self, action, kind, key, spec=None, item_id=None ): #pylint: disable=too-many-arguments
+        self.action = action # nb: "create" or "delete"
+        self.kind = kind # nb: "folder", "channel", "report" or "workpad"
+        self.key = key
+        self.spec = spec
+        self.item_id = item_id
+        self.result = None
+
+    def __str__( self ):
+        if self.action == "delete":
+            return "- delete {}: {} (id={})".format( self.kind, self.key, self.item_id )
+        return "+ create {}: {}".format( self.kind, self.key )
+
+# ---------------------------------------------------------------------
+
+class SyncPlan:
+    """The changes needed to bring Awasu's configuration into line with the desired state.
+
+    The changes are grouped into stages, which must be run in order (e.g. a folder has to be created
+    before its sub-folders), but the changes within a stage are independent of each other.
+    """
+
+    def __init__( self ):
+        self.stages = []
+
+    def add_stage( self, ops ):
+        """Add a stage to the plan (if it has anything in it)."""
+        if ops:
+            self.stages.append( ops )
+
+    def dump( self, out=None ):
+        """Dump the plan."""
+        out = out or sys.stdout
+        if not self.stages:
+            out.write( "Nothing to do.\n" )
+        for stage_no, ops in enumerate( self.stages, start=1 ):
+            out.write( "Stage {}:\n".format( stage_no ) )
+            for op in ops:
+                out.write( "  {}\n".format( op ) )
+
+    def __len__( self ):
+        return sum( len(ops) for ops in self.stages )
+
+    def __str__( self ):
+        return "SyncPlan: stages={} ; ops={}".format( len(self.stages), len(self) )
+
+# ---------------------------------------------------------------------
+
+class ConfigSync:
+    """Synchronizes Awasu's configuration with a description of how it should be.
+
+    The desired state is a dict that looks like this:
+        {
+            "folders": [ "News", "News/Tech" ],
+            "channels": [ { "feedUrl": "https://..." }, { "name": "...", "postData": "<channel>...</channel>" } ],
+            "workpads": [ { "name": "To Read", "description": "..." } ],
+            "reports": [
+                { "name": "Tech News", "channelFolders": [ "News/Tech" ], "includeSubfolders": true },
+                { "name": "Reading List", "workpad": "To Read" },
+                { "name": "Alerts", "channelFilter": "Alerts" },
+                { "name": "...", "postData": "<channelReport>...</channelReport>" }
+            ]
+        }
+    Folders are identified by their path, channels by their feed URL (or name, if they are created from
+    POST data), and reports and workpads by their name. Only the kinds of item that are present in the
+    desired state are synchronized, and for these, items that exist in Awasu but aren't wanted are deleted.
+    Items that exist, but are configured differently, are left alone.
+    """
+
+    def __init__( self, api, max_workers=None ):
+        self.api = api
+        self.max_workers = max_workers or AwasuApi.DEFAULT_MAX_WORKERS
+
+    def snapshot( self ):
+        """Get the current configuration, as a dict of kind => { key: ID }.
+
+        Since channels can be identified by feed URL or name, there is also a "channelNames" entry.
+        """
+        def get_folders():
+            # NOTE: The root folder can't be created or deleted, so we leave it out.
+            with ChannelFolderTree( self.api, ttl=0 ) as tree:
+                return { folder.path: folder.id for folder in tree.iter_subtree() if folder.path }
+        def get_channels():
+            return self.api.get_channels()
+        def get_reports():
+            return { r["name"]: normalize_id( r["id"] ) for r in self.api.get_reports() }
+        def get_workpads():
+            return { w["name"]: normalize_id( w["id"] ) for w in self.api.get_workpads() }
+        kinds = [ ( "folders", get_folders ), ( "channels", get_channels ),
+                  ( "reports", get_reports ), ( "workpads", get_workpads ) ]
+        results = run_concurrently( lambda kind: kind[1](), kinds, len(kinds) )
+        for result in results:
+            if isinstance( result, Exception ):
+                raise result
+        current = dict( zip( ( kind[0] for kind in kinds ), results ) )
+        channels = current["channels"]
+        current["channels"] = { _get_channel_key( c ): normalize_id( c["id"] ) for c in channels }
+        current["channelNames"] = { c["name"]: normalize_id( c["id"] ) for c in channels if "name" in c }
+        return current
+
+    def plan( self, desired, current=None ):
+        """Work out what needs to be done to bring Awasu's configuration into line with the desired state."""
+        if current is None:
+            current = self.snapshot()
+        # NOTE: A folder can only exist if its parent folders do, so they are wanted as well.
+        desired_folders = {}
+        for path in desired.get( "folders" ) or []:
+            path = _normalize_path( path )
+            for parent_path in _get_parent_paths( path ):
+                desired_folders.setdefault( parent_path, parent_path )
+            desired_folders[ path ] = path
+        desired = {
+            "folders": desired_folders,
+            "channels": { _get_channel_key( spec ): spec for spec in desired.get( "channels" ) or [] },
+            "reports": { spec["name"]: spec for spec in desired.get( "reports" ) or [] },
+            "workpads": { spec["name"]: spec for spec in desired.get( "workpads" ) or [] },
+            "_managed": [ kind for kind in ( "folders", "channels", "reports", "workpads" ) if kind in desired ],
+        }
+        # NOTE: A channel matches if either its feed URL or its name matches.
+        channel_names = { item_id: name for name, item_id in current.get( "channelNames", {} ).items() }
+        def is_wanted( kind, key, item_id ):
+            if key in desired[kind]:
+                return True
+            return kind == "channels" and channel_names.get( item_id ) in desired[kind]
+        def exists( kind, key ):
+            return key in current[kind] or ( kind == "channels" and key in current.get( "channelNames", {} ) )
+        def get_deletes( kind ):
+            if kind not in desired["_managed"]:
+                return []
+            return [
+                SyncOp( "delete", kind[:-1], key, None, item_id )
+                for key, item_id in sorted( current[kind].items() ) if not is_wanted( kind, key, item_id )
+            ]
+        def get_creates( kind ):
+            return [
+                SyncOp( "create", kind[:-1], key, spec )
+                for key, spec in desired[kind].items() if not exists( kind, key )
+            ]
+        plan = SyncPlan()
+        # NOTE: Reports can refer to workpads and folders, so they get deleted first, and created last.
+        plan.add_stage( get_deletes( "reports" ) + get_deletes( "channels" ) )
+        # NOTE: Deleting a folder also deletes its sub-folders, so we only need to delete the top-most ones.
+        folder_deletes = get_deletes( "folders" )
+        deleted_paths = set( op.key for op in folder_deletes )
+        plan.add_stage( get_deletes( "workpads" ) + [
+            op for op in folder_deletes if not any( parent in deleted_paths for parent in _get_parent_paths( op.key ) )
+        ] )
+        # NOTE: Folders have to be created before their sub-folders, so we create them one level at a time.
+        folder_creates = get_creates( "folders" )
+        for depth in sorted( set( op.key.count( "/" ) for op in folder_creates ) ):
+            plan.add_stage( [ op for op in folder_creates if op.key.count( "/" ) == depth ] )
+        plan.add_stage( get_creates( "workpads" ) + get_creates( "channels" ) )
+        plan.add_stage( get_creates( "reports" ) )
+        return plan
+
+    def apply( self, plan, current=None ):
+        """Make the changes in a plan.
+
+        Each stage is run in turn, with the changes in it made in parallel. If any of them fail,
+        the remaining stages are not run.
+        """
+        if current is None:
+            current = self.snapshot()
+        # NOTE: New items may need the ID's of items that were created in an earlier stage (e.g. a sub-folder
+        # needs its parent folder's ID), so we keep track of them as they are created.
+        ids = { kind: dict( items ) for kind, items in current.items() }
+        for ops in plan.stages:
+            errors = []
+            # delete items
+            # NOTE: We delete items in bulk, since the API supports it.
+            for kind, func in ( ( "channel", self.api.delete_channels ), ( "report", self.api.delete_reports ),
+                                ( "workpad", self.api.delete_workpads ) ):
+                delete_ops = [ op for op in ops if op.action == "delete" and op.kind == kind ]
+                if delete_ops:
+                    try:
+                        func( [ op.item_id for op in delete_ops ] )
+                    except Exception as xcptn: #pylint: disable=broad-except
+                        errors.append( xcptn )
+            # make the other changes
+            other_ops = [ op for op in ops if op.action == "create" or op.kind == "folder" ]
+            results = run_concurrently( lambda op: self._apply_op( op, ids ), other_ops, self.max_workers )
+            for op, result in zip( other_ops, results ):
+                op.result = result
+                if isinstance( result, Exception ):
+                    errors.append( result )
+                elif op.action == "create":
+                    ids[ op.kind+"s" ][ op.key ] = result
+            if errors:
+                raise AwasuApiException( "Can't sync the configuration ({} error(s)): {}".format(
+                    len(errors), errors[0]
+                ) )
+
+    def sync( self, desired, dry_run=False, out=None ):
+        """Bring Awasu's configuration into line with the desired state, and return the plan that was used.
+
+        In dry-run mode, the plan is output, but not applied.
+        """
+        current = self.snapshot()
+        plan = self.plan( desired, current )
+        if dry_run:
+            plan.dump( out )
+        else:
+            self.apply( plan, current )
+        return plan
+
+    def _apply_op( self, op, ids ):
+        """Make a single change."""
+        #pylint: disable=too-many-return-statements
+        spec = op.spec
+        if op.kind == "folder":
+            if op.action == "delete":
+                return self.api.delete_channel_folder( op.item_id )
+            parent_path, _, name = op.key.rpartition( "/" )
+            parent_id = ids["folders"][ parent_path ] if parent_path else None
+            return normalize_id( self.api.create_channel_folder( name, parent_id ) )
+        if op.kind == "channel":
+            if "postData" in spec:
+                return self.api.create_channel( spec["postData"] )
+            return self.api.create_channel_by_url( spec["feedUrl"] )
+        if op.kind == "workpad":
+            return normalize_id( self.api.create_workpad( spec["name"], spec.get( "description" ) ) )
+        if op.kind == "report":
+            name, descrip = spec["name"], spec.get( "description" )
+            if "postData" in spec:
+                report_id = self.api.create_report( spec["postData"] )
+            elif "workpad" in spec:
+                report_id = self.api.create_workpad_report( name, ids["workpads"][spec["workpad"]], descrip )
+            elif "channelFolders" in spec:
+                cf_ids = [ ids["folders"][ _normalize_path( path ) ] for path in spec["channelFolders"] ]
+                report_id = self.api.create_channel_folders_report(
+                    name, cf_ids, spec.get( "includeSubfolders", True ), descrip
+                )
+            else:
+                report_id = self.api.create_channel_filter_report( name, spec["channelFilter"], descrip )
+            return normalize_id( report_id )
+        raise AwasuApiException( "Unknown item type: {}".format( op.kind ) )
+
+# ---------------------------------------------------------------------
+
+def _get_channel_key( channel ):
+    """Get the key that identifies a channel."""
+    return channel.get( "feedUrl" ) or channel["name"]
+
+def _normalize_path( path ):
+    """Normalize a folder path."""
+    return "/".join( p for p in path.split( "/" ) if p )
+
+def _get_parent_paths( path ):
+    """Get the paths of a folder's ancestors."""
+    parts = path.split( "/" )
+    return [ "/".join( parts[:i] ) for i in range( 1, len(parts) ) ]
@@ -28,7 +28,36 @@
 #               - This notice may not be removed or altered from any
 #                 source distribution.
 
-import xml.sax.saxutils
+import collections
+import importlib
+
+# ---------------------------------------------------------------------
+
+class _LazyModule:
+    """Stands in for a module, and only imports it when it's first used."""
+
+    def __init__( self, module_name ):
+        self._module_name = module_name
+        self._module = None
+
+    def __getattr__( self, attr ):
+        # NOTE: import_module() holds the import lock while it loads the module, so this is thread-safe.
+        if self._module is None:
+            self._module = importlib.import_module( self._module_name )
+        return getattr( self._module, attr )
+
+    def __repr__( self ):
+        return "<lazy module '{}'>".format( self._module_name )
+
+def lazy_import( module_name ):
+    """Import a module, but don't actually load it until it's first used.
+
+    This keeps the package fast to import (which matters for short-lived scripts), since some of the modules
+    we use (e.g. xml.etree, asyncio, concurrent.futures) are slow to load, and may never be needed.
+    """
+    return _LazyModule( module_name )
+
+futures = lazy_import( "concurrent.futures" )
 
 # ---------------------------------------------------------------------
 
@@ -62,10 +91,77 @@ def safe_xml_string( val ):
     """Convert a value into something that's safe for inclusion in XML."""
     if val is None:
         return ""
-    return xml.sax.saxutils.escape( str(val) )
+    # NOTE: This is the same as xml.sax.saxutils.escape(), but that module is slow to import.
+    return str(val).replace( "&", "&amp;" ).replace( "<", "&lt;" ).replace( ">", "&gt;" )
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def quote_xml_attr( val ):
+    """Quote a value for use as an XML attribute."""
+    # NOTE: This is the same as xml.sax.saxutils.quoteattr( str(val) ) (except that it always uses double quotes).
+    # nb: unlike safe_xml_string(), None is converted to "None"
+    return '"{}"'.format(
+        safe_xml_string( str(val) ).replace( '"', "&quot;" ) \
+            .replace( "\n", "&#10;" ).replace( "\r", "&#13;" ).replace( "\t", "&#9;" )
+    )
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def bool_string( val ):
     """Convert a value to a boolean string."""
     return "true" if val else "false"
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def normalize_id( val ):
+    """Normalize an ID returned by Awasu."""
+    # NOTE: ID's sometimes come back from Awasu as strings, and callers may pass them in as ints.
+    try:
+        return int( val )
+    except ( TypeError, ValueError ):
+        return val
+
+# ---------------------------------------------------------------------
+
+def iter_concurrently( func, items, max_workers, progress=None ):
+    """Call a function for each item, using a pool of worker threads.
+
+    Results are yielded in the same order as the items. If a call raises an exception,
+    the exception object is yielded in place of its result, so one failure doesn't abort
+    the whole batch. Items are consumed lazily, and only a small window of them
+    is in progress at any time, so memory use doesn't depend on how many there are.
+
+    If a progress callback is given, it is called with the number of items completed so far,
+    and the latest result.
+    """
+    pending = collections.deque()
+    n_done = 0
+    def next_result():
+        nonlocal n_done
+        result = pending.popleft().result()
+        n_done += 1
+        if progress:
+            progress( n_done, result )
+        return result
+    with futures.ThreadPoolExecutor( max_workers ) as pool:
+        try:
+            for item in items:
+                pending.append( pool.submit( _call_and_capture, func, item ) )
+                if len(pending) >= 2*max_workers:
+                    yield next_result()
+            while pending:
+                yield next_result()
+        finally:
+            # nb: in case the caller stopped iterating early
+            for future in pending:
+                future.cancel()
+
+def run_concurrently( func, items, max_workers, progress=None ):
+    """Call a function for each item, using a pool of worker threads, and return the results as a list."""
+    return list( iter_concurrently( func, items, max_workers, progress ) )
+
+def _call_and_capture( func, item ):
+    try:
+        return func( item )
+    except Exception as xcptn: #pylint: disable=broad-exception-caught
+        return xcptn
@@ -11,6 +11,9 @@ setup(
     author_email = "support@awasu.com",
     packages = [ "awasu_api" ],
     entry_points = {
-        "console_scripts": "awasu-api = awasu_api.console:main",
+        "console_scripts": [
+            "awasu-api = awasu_api.console:main",
+            "awasu-api-benchmark = awasu_api.benchmark:main",
+        ],
     }
 )